@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""
+Benchmark of AmberLogFile against the original text-mode parser.
+
+    $ python benchmarks/bench_amber.py [NFRAME]
+
+A synthetic mdout with NFRAME (default: 100000) energy blocks is generated in
+a temporary directory.
+"""
+
+from __future__ import print_function
+import collections
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymdlog.amberlogfile import AmberLogFile
+
+TITLE = r'\s+(?P<title>(\d-\d )?[a-zA-Z]+)(\([a-zA-Z]+\))?'
+NUMBER = r'(?P<value>[+-]?([1-9]\d*\.\d*|0?\.\d*|[1-9]\d*|0))'
+PAT_BEGIN = re.compile(r'\s+\d\.\s+RESULTS\b')
+PAT_ITEM = re.compile(TITLE + r'\s*=\s*' + NUMBER)
+PAT_END = re.compile(r'\s+A V E R A G E S   O V E R')
+
+
+def make_mdout(fname, nframe):
+    """Write an AMBER-like mdout file with NMR restraint output."""
+    rand = random.Random(0)
+
+    def e():
+        return rand.uniform(-1e5, 1e5)
+
+    with open(fname, 'w') as f:
+        f.write('          Amber 12 SANDER                              2012\n')
+        for i in range(200):
+            f.write('| header line %d\n' % i)
+        f.write('---------------------------------------------------------\n'
+                '   4.  RESULTS\n'
+                '---------------------------------------------------------\n\n')
+        for i in range(1, nframe+1):
+            f.write(' NSTEP = %8d   TIME(PS) = %11.3f  TEMP(K) = %9.2f  '
+                    'PRESS = %8.1f\n' % (i*500, i, rand.uniform(290, 310),
+                                         rand.uniform(-100, 100)))
+            f.write(' Etot   = %14.4f  EKtot   = %14.4f  EPtot      = %14.4f\n'
+                    ' BOND   = %14.4f  ANGLE   = %14.4f  DIHED      = %14.4f\n'
+                    ' 1-4 NB = %14.4f  1-4 EEL = %14.4f  VDWAALS    = %14.4f\n'
+                    ' EELEC  = %14.4f  EHBOND  = %14.4f  RESTRAINT  = %14.4f\n'
+                    % tuple(e() for _ in range(12)))
+            f.write(' EAMBER (non-restraint)  = %14.4f\n' % e())
+            f.write(' Ewald error estimate:   0.1234E-03\n')
+            f.write(' --------------------------------------------------'
+                    '----------------------------\n\n')
+            f.write(' NMR restraints: Bond =    0.000   Angle =     0.000   '
+                    'Torsion =     0.000\n')
+            f.write(' =================================================='
+                    '=============================\n')
+        f.write('\n      A V E R A G E S   O V E R  %d S T E P S\n' % nframe)
+
+
+def read_original(fname):
+    """The original parser, which runs the patterns on every line."""
+    data = collections.defaultdict(list)
+    with open(fname) as fp:
+        for line in fp:
+            if PAT_BEGIN.match(line) is not None:
+                break
+        for line in fp:
+            if not line.startswith(' '):
+                continue
+            for i in PAT_ITEM.finditer(line):
+                k, v = i.group('title'), i.group('value')
+                try:
+                    n = int(v)
+                except ValueError:
+                    n = float(v)
+                data[k].append(n)
+            if PAT_END.match(line) is not None:
+                break
+    return data
+
+
+def timeit(func, *args):
+    start = time.time()
+    result = func(*args)
+    return time.time() - start, result
+
+
+def main():
+    nframe = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    tmpdir = tempfile.mkdtemp()
+    try:
+        fname = os.path.join(tmpdir, 'bench.out')
+        make_mdout(fname, nframe)
+        size = os.path.getsize(fname) / 1e6
+        print('%d frames, %.1f MB' % (nframe, size))
+
+        t0, old = timeit(read_original, fname)
+        t1, new = timeit(lambda: AmberLogFile(fname).read())
+        assert list(old) == list(new)
+        for t in old:
+            assert old[t] == list(new[t]), t
+        print('original: %6.2f s %7.1f MB/s' % (t0, size/t0))
+        print('current:  %6.2f s %7.1f MB/s' % (t1, size/t1))
+        print('speedup:  %6.2fx' % (t0/t1))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
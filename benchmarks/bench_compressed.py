@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""
+Benchmark of reading compressed NAMD logs against piping them from zcat.
+
+    $ python benchmarks/bench_compressed.py [NFRAME]
+
+A synthetic log with NFRAME (default: 1000000) ENERGY lines (see
+bench_namd.py) is generated and compressed with gzip, bzip2 and xz in a
+temporary directory. Each compressed log is parsed
+
+* from a pipe of the command-line tool (zcat, bzcat, xzcat), like
+  `zcat md.log.gz | pymdlog`,
+* by NamdLogFile, decompressed by a thread ahead of the parser,
+* and decompressed by the parser itself, without the thread.
+
+The throughput is of the uncompressed bytes.
+"""
+
+from __future__ import print_function
+import bz2
+import gzip
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_namd import TITLES, make_log
+from pymdlog.compressed import open_compressed
+from pymdlog.namdlogfile import NamdLogFile
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+# command-line tools and modules of each compression
+TOOLS = [('gzip', '.gz', 'zcat', gzip), ('bz2', '.bz2', 'bzcat', bz2),
+         ('xz', '.xz', 'xzcat', lzma)]
+
+
+class SerialLogFile(NamdLogFile):
+    """NamdLogFile decompressing in the thread of the parser."""
+
+    def open(self, filename, mode='rb'):
+        self.compression = 'serial'
+        return open_compressed(filename, ahead=0)
+
+
+def compress(fname, module, suffix):
+    out = fname + suffix
+    with open(fname, 'rb') as f:
+        data = f.read()
+    with module.open(out, 'wb') as f:
+        f.write(data)
+    return out
+
+
+def read_pipe(tool, fname):
+    proc = subprocess.Popen([tool, fname], stdout=subprocess.PIPE)
+    try:
+        return NamdLogFile('/dev/fd/%d' % proc.stdout.fileno()).read()
+    finally:
+        proc.stdout.close()
+        proc.wait()
+
+
+def timeit(func, *args):
+    start = time.time()
+    result = func(*args)
+    return time.time() - start, result
+
+
+def which(tool):
+    for path in os.environ.get('PATH', '').split(os.pathsep):
+        if os.access(os.path.join(path, tool), os.X_OK):
+            return True
+    return False
+
+
+def main():
+    nframe = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    tmpdir = tempfile.mkdtemp()
+    try:
+        fname = os.path.join(tmpdir, 'bench.log')
+        make_log(fname, nframe)
+        size = os.path.getsize(fname) / 1e6
+        print('%d frames, %.1f MB' % (nframe, size))
+
+        t, plain = timeit(lambda: NamdLogFile(fname).read())
+        print('%-22s %6.2f s %7.1f MB/s' % ('uncompressed', t, size/t))
+        for kind, suffix, tool, module in TOOLS:
+            if module is None:
+                print('%s: no module' % kind)
+                continue
+            zname = compress(fname, module, suffix)
+            print('%s: %.1f MB' % (kind, os.path.getsize(zname) / 1e6))
+            runs = [('threaded', lambda: NamdLogFile(zname).read()),
+                    ('serial', lambda: SerialLogFile(zname).read())]
+            if which(tool):
+                runs.insert(0, ('%s |' % tool, lambda: read_pipe(tool, zname)))
+            for name, func in runs:
+                t, data = timeit(func)
+                for title in TITLES:
+                    assert list(data[title]) == list(plain[title]), title
+                print('  %-20s %6.2f s %7.1f MB/s' % (name, t, size/t))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
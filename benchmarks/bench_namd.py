@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+Benchmark of NamdLogFile against the original line-by-line parser.
+
+    $ python benchmarks/bench_namd.py [NFRAME]
+
+A synthetic log with NFRAME (default: 1000000) ENERGY lines is generated in
+a temporary directory.
+"""
+
+from __future__ import print_function
+try:
+    from future_builtins import zip
+except ImportError:
+    pass
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymdlog.namdlogfile import NamdLogFile
+
+TITLES = ('TS BOND ANGLE DIHED IMPRP ELECT VDW BOUNDARY MISC KINETIC TOTAL '
+          'TEMP POTENTIAL TOTAL3 TEMPAVG PRESSURE GPRESSURE VOLUME PRESSAVG '
+          'GPRESSAVG').split()
+
+
+def make_log(fname, nframe):
+    """Write a NAMD-like log file."""
+    rand = random.Random(0)
+    with open(fname, 'w') as f:
+        f.write('Info: NAMD 2.9 for Linux-x86_64-multicore\n')
+        f.write('ETITLE:' + ''.join('%15s' % t for t in TITLES) + '\n\n')
+        for i in range(nframe):
+            values = ['%.4f' % rand.uniform(-1e5, 1e5) for t in TITLES[1:]]
+            f.write('ENERGY:' + '%15d' % (i*10) +
+                    ''.join('%15s' % v for v in values) + '\n')
+            if not i % 100:
+                f.write('\nTIMING: %d  CPU: 1.0, 0.1/step\n\n' % i)
+
+
+def read_original(fname):
+    """The original parser, which converts token by token."""
+
+    def to_number(x):
+        try:
+            n = int(x)
+        except ValueError:
+            n = float(x)
+        return n
+
+    with open(fname) as fp:
+        for line in fp:
+            if line.startswith('ETITLE:'):
+                titles = line.split()[1:]
+                break
+        n = len(titles)
+        values = []
+        for i, line in enumerate(fp):
+            if line.startswith('ENERGY:'):
+                val = [to_number(x) for x in line.split()[1:]]
+                if len(val) != n:
+                    raise RuntimeError('File broken at line %d' % (i+1))
+                values.append(val)
+    return dict(zip(titles, zip(*values)))
+
+
+def timeit(func, *args):
+    start = time.time()
+    result = func(*args)
+    return time.time() - start, result
+
+
+def main():
+    nframe = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    tmpdir = tempfile.mkdtemp()
+    try:
+        fname = os.path.join(tmpdir, 'bench.log')
+        make_log(fname, nframe)
+        size = os.path.getsize(fname) / 1e6
+        print('%d frames, %.1f MB' % (nframe, size))
+
+        t0, old = timeit(read_original, fname)
+        t1, new = timeit(lambda: NamdLogFile(fname).read())
+        for t in TITLES:
+            assert list(old[t]) == list(new[t]), t
+        print('original: %6.2f s %7.1f MB/s' % (t0, size/t0))
+        print('current:  %6.2f s %7.1f MB/s' % (t1, size/t1))
+        print('speedup:  %6.2fx' % (t0/t1))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
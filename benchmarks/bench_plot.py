@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""
+Benchmark of decimating the frames plotted while zooming and panning.
+
+    $ python benchmarks/bench_plot.py [NFRAME]
+
+A random walk of NFRAME (default: 10000000) frames is decimated for a plot
+2000 points wide, like a plot of the GUI, at x ranges from all frames down
+to a few thousand, as when zooming in and panning. The frames of each range
+are chosen
+
+* by MinMaxPyramid.view, as by the GUI, after the pyramid is made once,
+* and by minmax_indices of the frames in the range, for comparison.
+
+A plot keeps up with 30 frames per second if a range takes < 33 ms
+(not counting the drawing by matplotlib).
+"""
+
+from __future__ import division, print_function
+from array import array
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pymdlog.reduction import MinMaxPyramid, minmax_indices
+
+NPOINT = 2000
+
+
+def make_data(nframe):
+    random.seed(0)
+    x = array('d', range(nframe))
+    y = array('d', [0.0]) * nframe
+    v = 0.0
+    for i in range(nframe):
+        v += random.random() - 0.5
+        y[i] = v
+    return x, y
+
+
+def ranges(nframe, count=20):
+    # zooming in 4 times at a time, each panned a bit
+    width = nframe
+    while width > NPOINT:
+        for _ in range(count):
+            x0 = random.uniform(0, nframe-width)
+            yield x0, x0 + width
+        width //= 4
+
+
+def main():
+    nframe = int(sys.argv[1]) if len(sys.argv) > 1 else 10000000
+    x, y = make_data(nframe)
+    print('%d frames' % nframe)
+
+    start = time.time()
+    pyr = MinMaxPyramid(x, y)
+    print('%-16s %8.2f s (once)' % ('pyramid', time.time() - start))
+
+    views = list(ranges(nframe))
+    start = time.time()
+    for x0, x1 in views:
+        pyr.view(x0, x1, NPOINT)
+    t = (time.time() - start) / len(views)
+    print('%-16s %8.3f ms per range' % ('view', t*1000))
+
+    start = time.time()
+    for x0, x1 in views:
+        i0, i1 = int(x0), int(x1) + 1
+        minmax_indices(y[i0:i1], NPOINT)
+    t = (time.time() - start) / len(views)
+    print('%-16s %8.3f ms per range' % ('minmax_indices', t*1000))
+
+
+if __name__ == '__main__':
+    main()
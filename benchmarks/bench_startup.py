@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""
+Benchmark of the start-up time of the command-line mode.
+
+    $ python benchmarks/bench_startup.py [REPEAT]
+
+`import pymdlog.cmd` is timed with `python -X importtime` (Python 3.7+).
+The slowest imports are listed, and the exit status is 1 if any of the
+modules only needed by the GUI, plotting or parallel parsing is imported.
+"""
+
+from __future__ import print_function
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules which must not be imported for a headless run
+LAZY = ('tkinter', 'Tkinter', 'matplotlib', 'multiprocessing', 'numpy')
+
+
+def importtime():
+    """Return {module: (self, cumulative)} in microseconds."""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [ROOT] + [p for p in [env.get('PYTHONPATH')] if p])
+    proc = subprocess.Popen([sys.executable, '-X', 'importtime', '-c',
+                             'import pymdlog.cmd'],
+                            stderr=subprocess.PIPE, env=env, cwd=ROOT)
+    _, err = proc.communicate()
+    if proc.returncode:
+        raise RuntimeError(err.decode())
+    times = {}
+    for line in err.decode().splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        fields = line[len('import time:'):].split('|')
+        try:
+            own, cum = int(fields[0]), int(fields[1])
+        except ValueError:
+            # the header
+            continue
+        times[fields[2].strip()] = (own, cum)
+    return times
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    runs = [importtime() for _ in range(repeat)]
+    total = sorted(r['pymdlog.cmd'][1] for r in runs)[repeat // 2]
+    print('import pymdlog.cmd: %.1f ms (median of %d)' % (total/1e3, repeat))
+
+    print('slowest imports:')
+    last = runs[-1]
+    for name, (own, _) in sorted(last.items(), key=lambda i: -i[1][0])[:10]:
+        print('  %-30s %6.1f ms' % (name, own/1e3))
+
+    bad = sorted(m for m in last if m.split('.')[0] in LAZY)
+    if bad:
+        print('FAIL: imported at start-up: %s' % ', '.join(bad))
+        sys.exit(1)
+    print('OK: no GUI, plotting or multiprocessing modules imported')
+
+
+if __name__ == '__main__':
+    main()
@@ -3,69 +3,209 @@ Module to parse AMBER output files.
 """
 
 from __future__ import absolute_import
-import collections
 import re
 import warnings
 
 from .basefile import ReadOnlyTextFile
+from .columns import ColumnData
+from .profiling import Tally, count, enabled, stage, value_count
 
 __all__ = ['AmberLogFile']
 
+# the file is read in binary mode, and the patterns match bytes.
+
 # "   4.  RESULTS"
-PAT_BEGIN = re.compile(r'\s+\d\.\s+RESULTS\b')
+PAT_BEGIN = re.compile(br'\s+\d\.\s+RESULTS\b')
 
 # "TITLE = NUMBER"
 # something like "NSTEP", "1-4 NB", "TIME(PS)", ignore the units
-TITLE = r'\s+(?P<title>(\d-\d )?[a-zA-Z]+)(\([a-zA-Z]+\))?'
-EQ = r'='
-NUMBER = r'(?P<value>[+-]?([1-9]\d*\.\d*|0?\.\d*|[1-9]\d*|0))'
-PAT_ITEM = re.compile(TITLE + r'\s*' + EQ + r'\s*' + NUMBER)
+TITLE = br'\s+(?P<title>(?:\d-\d )?[a-zA-Z]+)(?:\([a-zA-Z]+\))?'
+EQ = br'='
+NUMBER = br'(?P<value>[+-]?(?:[1-9]\d*\.\d*|0?\.\d*|[1-9]\d*|0))'
+PAT_ITEM = re.compile(TITLE + br'\s*' + EQ + br'\s*' + NUMBER)
 
 # "      A V E R A G E S   O V E R"
-PAT_END = re.compile(r'\s+A V E R A G E S   O V E R')
+PAT_END = re.compile(br'\s+A V E R A G E S   O V E R')
+
+# " NSTEP =      500", the beginning of a frame
+PAT_STEP = re.compile(br'^ NSTEP =\s*(\d+)\s', re.M)
+
+# "          Amber 12 SANDER                              2012", the banner,
+# or the beginning of the "RESULTS" section in a short file
+PAT_SNIFF = re.compile(br'Amber\s+\d+\s+(?:SANDER|PMEMD)|\s\d\.\s+RESULTS\b')
 
 
 class AmberLogFile(ReadOnlyTextFile):
-    """Parse an AMBER (including CHAMBER) mdout file."""
+    """Parse an AMBER (including CHAMBER) mdout file.
+
+    If columns is given, only the energy items of these titles are stored.
+    If select (a `FrameSelection`) is given, the items of the frames not
+    selected are skipped, and if index is True too, a step index (see
+    `StepIndex`) is used to seek to them.
+    """
     filetype = "AMBER mdout"
+    modes = {'r': 'rb'}
+    # default x data set, the data set of the steps, and the pattern of the
+    # files of a run, see registry
+    x_title = 'TIME'
+    step_title = 'NSTEP'
+    pattern = '*.out'
+    # the averages at the end also begin with NSTEP, which is the last step
+    pat_step = PAT_STEP
 
-    def __init__(self, *args, **kwargs):
-        super(AmberLogFile, self).__init__(*args, **kwargs)
+    def __init__(self, filename, mode='r', columns=None, select=None,
+                 index=False):
+        super(AmberLogFile, self).__init__(filename, mode)
         self.pat_begin = PAT_BEGIN
         self.pat_item = PAT_ITEM
         self.pat_end = PAT_END
+        self.columns = columns
+        self.select = select
+        self.use_index = index
+        # whether the items of the current frame are kept
+        self.kept = True
+        # decoded titles, or '' for the items not in columns
+        self.titles = {}
+        # state of the "RESULTS" section when following the file
+        self.started = self.finished = False
+
+    @classmethod
+    def sniff(cls, head):
+        """Return whether head, the first bytes of a file, are of an AMBER
+        mdout file, by the banner."""
+        return PAT_SNIFF.search(head) is not None
 
-    def read(self):
+    def read(self, container=ColumnData):
+        """Read the energy items into container, which is called without
+        arguments and filled item by item (default: `ColumnData`)."""
         super(AmberLogFile, self).read()
-        data = collections.defaultdict(list)
+        data = container()
 
         # forward the generator to the "RESULTS" section
-        for line in self.fp:
-            if self.pat_begin.match(line) is not None:
-                break
-        else:
+        lines = iter(self.fp)
+        if not self.find_results(lines):
             # can't find the beginning tag, which means a invalid file
             raise RuntimeError("Invalid %s file: '%s'" % (
                                self.filetype, self.filename))
+        if self.seek_selected() or self.limit is not None:
+            lines = self.iter_lines()
 
         # parse data
-        for line in self.fp:
-            if not line.startswith(' '):
-                continue
-            items = self.pat_item.finditer(line)
-            for i in items:
-                k, v = i.group('title'), i.group('value')
-                try:
-                    n = int(v)
-                except ValueError:
-                    n = float(v)
-                data[k].append(n)
-            if self.pat_end.match(line) is not None:
-                break
-        else:
+        if not (self.parse_results(lines, data) or self.reached_limit()):
             # can't find the ending tag, which means a broken file
             warnings.warn("Broken %s file: '%s'" % (
                           self.filetype, self.filename))
 
         self.data = data
         return self.data
+
+    def iter_data(self, container=ColumnData, size=1 << 22):
+        """Read the energy items batch by batch, and yield a new container
+        with the items found in each batch of about size bytes of lines, so
+        that the whole data is never kept in memory. The items of a frame
+        may be split between two containers."""
+        super(AmberLogFile, self).read()
+        started = finished = False
+        while not finished:
+            with stage('read'):
+                lines = self.fp.readlines(size)
+            if not lines:
+                break
+            lines = iter(lines)
+            if not started:
+                started = self.find_results(lines)
+                if not started:
+                    continue
+                if self.seek_selected():
+                    continue
+            data = container()
+            finished = self.parse_results(lines, data)
+            yield data
+            if self.reached_limit():
+                return
+
+        if not started:
+            raise RuntimeError("Invalid %s file: '%s'" % (
+                               self.filetype, self.filename))
+        if not finished:
+            warnings.warn("Broken %s file: '%s'" % (
+                          self.filetype, self.filename))
+
+    def update(self, container=ColumnData):
+        """Parse the lines appended to the file since the last call, which
+        is used to follow the output of a running simulation. Return a new
+        container with the items found in these lines."""
+        data = container()
+        if self.finished:
+            return data
+        for lines in self.read_appended():
+            lines = iter(lines)
+            if not self.started:
+                self.started = self.find_results(lines)
+                if not self.started:
+                    continue
+            if self.parse_results(lines, data):
+                self.finished = True
+                break
+        return data
+
+    def find_results(self, lines):
+        """Consume lines up to the beginning of the "RESULTS" section.
+        Return True if it is found."""
+        for line in lines:
+            if b'RESULTS' in line and self.pat_begin.match(line) is not None:
+                return True
+        return False
+
+    def parse_results(self, lines, data):
+        """Parse lines of the "RESULTS" section into data. Return True if
+        the end of the section is found."""
+        findall = self.pat_item.findall
+        if not enabled():
+            return self._parse_results(lines, data, findall)
+        # the lines and the matching ones are counted as they are parsed
+        lines, findall = Tally(lines), Tally(findall)
+        nvalue = value_count(data)
+        with stage('parse'):
+            finished = self._parse_results(lines, data, findall)
+        count('bytes read', lines.size)
+        count('lines scanned', lines.n)
+        count('lines matched', findall.n)
+        count('values converted', value_count(data) - nvalue)
+        return finished
+
+    def _parse_results(self, lines, data, findall):
+        # only the lines with a "=" may have items, the others are skipped
+        # without running the patterns. PAT_ITEM has two groups, so findall
+        # gives (title, value) pairs, and the titles are decoded and checked
+        # against columns only once.
+        titles = self.titles
+        columns = self.columns
+        select = self.select
+        append = data.append
+        for line in lines:
+            if not line.startswith(b' '):
+                continue
+            if b'=' in line:
+                if select is not None:
+                    # a frame begins with NSTEP, and the lines of the
+                    # frames not selected are skipped up to the next one
+                    if line.startswith(b' NSTEP'):
+                        m = self.pat_step.match(line)
+                        if m is not None:
+                            self.kept = select.keep(int(m.group(1)))
+                    if not self.kept:
+                        continue
+                for k, v in findall(line):
+                    t = titles.get(k)
+                    if t is None:
+                        t = k.decode('ascii')
+                        if columns is not None and t not in columns:
+                            t = ''
+                        titles[k] = t
+                    if t:
+                        append(t, v)
+            elif b'A V E R A G E S' in line and \
+                    self.pat_end.match(line) is not None:
+                return True
+        return False
@@ -2,85 +2,523 @@
 Analysis of log files.
 """
 
-from __future__ import absolute_import
-import collections
+from __future__ import absolute_import, print_function
+from functools import partial
+import os
 import warnings
 
 from .amberlogfile import AmberLogFile
-from .namdlogfile import NamdLogFile
+from .archive import expand_inputs, is_member, sequential
+from .binfile import BinFile
+from .columns import STEP_TITLES, ColumnData
+from .compressed import compression
+from .namdlogfile import NamdLogFile, read_chunk
+from .profiling import count, enabled, run_profiled, stage, timed_iter
+from .profiling import merge as merge_profile
+from .registry import AUTO, detect, get_parser
+from .selection import FrameSelection, segment_ranges
 
 __all__ = ['LogAnalyzer']
 
+POOLS = ('process', 'thread')
+
 
 class LogAnalyzer(object):
-    """Analyzing AMBER (including CHAMBER) mdout and NAMD log files."""
+    """Analyzing AMBER (including CHAMBER) mdout and NAMD log files, the
+    binary data files written by PyMDLog, and the files of the parsers
+    registered by other packages (see `registry`)."""
 
-    def __init__(self, type):
-        # currently support 'amber' and 'namd'.
+    def __init__(self, type=AUTO, jobs=1, pool='process', cache=None):
+        # currently support 'amber', 'namd', 'binary' and the registered
+        # types, or 'auto' to detect the type of the files by their content
+        # files are parsed by a pool of jobs workers if jobs > 1
+        # parsed files are kept in cache, a ParseCache, if given
         self.data = None
+        self.cache = cache
         self.type = type.lower()
-        try:
-            self.func = {
-                    'amber': analyze_amber_log,
-                    'namd': analyze_namd_log
-                    }[self.type]
-        except KeyError:
-            raise ValueError("Unsupported file type %s" % type)
-
-    def analyze(self, *filename):
-        self.data = self.func(*filename)
+        self.jobs = jobs
+        if pool not in POOLS:
+            raise ValueError("Unsupported pool type %s" % pool)
+        self.pool = pool
+        if self.type != AUTO:
+            get_parser(self.type)
+
+    def detect(self, filename):
+        """Return the file type and the parser class of the files, whose
+        first bytes are checked before parsing, so a file of another type
+        fails at once. The type is detected by them if it's auto."""
+        return detect(expand_inputs(filename), self.type)
+
+    def analyze(self, *filename, **kwargs):
+        """Return the data sets found in the files as a `ColumnData`.
+
+        Pass container=StatsCollector to get the statistical results
+        without keeping the data in memory, columns (a list of titles) to
+        parse only these data sets, and select (a `FrameSelection`) to
+        parse only some of the frames, with index=True to seek to them by
+        the step indexes of the files (see `StepIndex`). Pass dedup='first'
+        or 'last' to drop the frames of the files overlapping the others
+        (see `segment_ranges`), which are recorded in select.drops if
+        select is given. Pass detected, the (type, parser class) returned
+        by `detect`, if the files are already checked.
+
+        The members of a tar archive are given as archive::pattern, which
+        are parsed in natural order (see `archive.expand`).
+        """
+        filename = expand_inputs(filename)
+        type, cls = kwargs.pop('detected', None) or self.detect(filename)
+        func = {
+                'amber': analyze_amber_log,
+                'namd': analyze_namd_log,
+                'binary': analyze_bin_file
+                }.get(type, partial(analyze_log, cls))
+        kwargs.setdefault('jobs', self.jobs)
+        kwargs.setdefault('pool', self.pool)
+        kwargs.setdefault('cache', self.cache)
+        self.data = func(*filename, **kwargs)
         return self.data
 
+    def analyze_batch(self, runs, **kwargs):
+        """Return the statistical results of many independent runs, which
+        are analyzed by a pool of jobs processes, one run by each. The
+        error of a failed run is given with its results instead of raised.
+        See `batch.run_batch` for the arguments and results.
+        """
+        # imported here as batch imports this module
+        from .batch import run_batch
+        kwargs.setdefault('jobs', self.jobs)
+        kwargs.setdefault('cache', self.cache)
+        return run_batch(self.type, runs, **kwargs)
 
-def analyze_amber_log(*filename):
-    """Analyzing Amber mdout file."""
-    data = collections.defaultdict(list)
+    def iter_analyze(self, *filename, **kwargs):
+        """Yield the data sets found in the files a batch of frames at a
+        time, each in a new `ColumnData`, without keeping the whole data.
+        The files are parsed one after another; the items of an AMBER frame
+        may be split between two batches (see `pipeline.FrameBuffer`).
+
+        Pass columns (a list of titles) to parse only these data sets, and
+        select (a `FrameSelection`) to parse only some of the frames, with
+        index=True to seek to them by the step indexes of the files, and
+        dedup to drop the overlaps of the files, and detected, like
+        `analyze`.
+        """
+        filename = expand_inputs(filename)
+        _, cls = kwargs.get('detected') or self.detect(filename)
+        if not hasattr(cls, 'iter_data'):
+            raise ValueError("Can't stream %s files." % cls.filetype)
+        select = kwargs.get('select')
+        dedup = kwargs.get('dedup')
+        columns = kwargs.get('columns')
+        if dedup or select is not None and select.by == 'step':
+            # the cached data are selected by the steps
+            columns = required(columns, getattr(cls, 'step_title', None))
+        return iter_files(cls, filename, self.cache, columns, select,
+                          kwargs.get('index', False), dedup)
+
+
+def _read_file(args):
+    """Parse a single file, run in the pool workers."""
+    cls, filename, container, columns = args
+    return cls(filename, columns=columns).read(container)
+
+
+def _read_chunk(args):
+    """Parse a byte range of a file, run in the pool workers."""
+    return read_chunk(*args)
+
+
+def imap(func, tasks, jobs=1, pool='process', ordered=True):
+    """Yield func(task) for tasks in order, or as they are done unless
+    ordered, computed by a pool of workers. If profiled, the workers of a
+    process pool record their stages, which are added to the profiles (see
+    `profiling`), and the time waiting for them is the pool stage."""
+    if not tasks:
+        return
+    # multiprocessing is imported here to keep the start-up fast
+    if pool == 'process':
+        from multiprocessing import Pool
+    else:
+        from multiprocessing.pool import ThreadPool as Pool
+    # the threads of a thread pool record in the profiles themselves
+    profiled = pool == 'process' and enabled()
+    if profiled:
+        func = partial(run_profiled, func)
+    workers = Pool(min(jobs, len(tasks)))
+    try:
+        results = (workers.imap(func, tasks) if ordered else
+                   workers.imap_unordered(func, tasks))
+        for result in timed_iter(results, 'pool'):
+            if profiled:
+                result, state = result
+                merge_profile(state)
+            yield result
+    finally:
+        workers.terminate()
+        workers.join()
+
+
+def probe_files(cls, filename, select, dedup=None):
+    """Return (file, range of steps) of the files which may have frames in
+    the range of steps of select, found by the first and last steps of each
+    file. The range is where the file doesn't overlap the others by the
+    policy dedup (see `segment_ranges`) if given, otherwise None."""
+    if getattr(cls, 'pat_step', None) is None:
+        if dedup:
+            raise ValueError("Can't find the overlaps of %s files." %
+                             cls.filetype)
+        return [(f, None) for f in filename]
+    if select.by != 'step' and not dedup:
+        return [(f, None) for f in filename]
+    bounds = []
+    for f in filename:
+        with cls(f) as log:
+            # only the overlaps are worth decompressing a whole file for
+            bounds.append(log.probe(scan=bool(dedup)))
+    ranges = (segment_ranges(bounds, dedup) if dedup else
+              [None] * len(filename))
+    kept = []
+    for f, b, r in zip(filename, bounds, ranges):
+        if b is None and dedup:
+            warnings.warn("No steps found in '%s', whose overlaps are not "
+                          "removed." % f)
+        if select.skips(b):
+            print("Skip %s file %s out of the step range" % (
+                  cls.filetype, os.path.basename(f)))
+        else:
+            kept.append((f, r))
+    return kept
+
+
+def report_drops(cls, filename, select):
+    """Report the frames of the file dropped for overlapping the others."""
+    drop = select.finish(os.path.basename(filename))
+    if drop is not None:
+        print("Drop %d frames of %s file %s overlapping the others, from "
+              "step %d to %d" % (drop[1], cls.filetype, drop[0], drop[2],
+                                 drop[3]))
+
+
+def open_selected(cls, filename, columns=None, select=None, index=False):
+    """Open a file with the parser class cls to parse the frames selected,
+    using the step index of the file if index is True and cls has one."""
+    if index and hasattr(cls, 'seek_selected'):
+        return cls(filename, columns=columns, select=select, index=True)
+    return cls(filename, columns=columns, select=select)
+
+
+def read_files(cls, filename, container=ColumnData, jobs=1, pool='process',
+               cache=None, columns=None, select=None, index=False,
+               dedup=None):
+    """Parse files with the parser class cls and yield the results in the
+    order of filename. The files are parsed concurrently if jobs > 1. Only
+    the data sets of the titles in columns are parsed if given.
+
+    If cache (a `ParseCache`) is given, the data of unchanged files are
+    loaded from it, and only the other files are parsed and then cached.
+
+    If select (a `FrameSelection`) is given, only the frames selected are
+    given. The files out of the range of steps are skipped, and the frames
+    of the others are skipped by the parsers, whose data are not cached.
+    When parsing concurrently, the frames are selected after parsing
+    instead, so the data of all frames are cached. Otherwise, with index,
+    the parsers seek to the frames selected by the step indexes.
+
+    If dedup (a policy of `segment_ranges`) is given, the files are taken
+    as segments of a run, and the frames overlapping the other files are
+    dropped like the frames not selected, and recorded in select.drops.
+    """
+    if dedup and select is None:
+        select = FrameSelection()
+    if select is not None:
+        files = probe_files(cls, filename, select, dedup)
+        try:
+            if jobs > 1 and container is ColumnData:
+                parsed = read_files(cls, [f for f, _ in files], container,
+                                    jobs, pool, cache, columns)
+                for (f, bounds), data in zip(files, parsed):
+                    select.bounds = bounds
+                    yield select.apply(data)
+                    report_drops(cls, f, select)
+                return
+            for f, bounds in files:
+                if select.finished:
+                    break
+                select.bounds = bounds
+                data = None
+                if cache is not None and container is ColumnData:
+                    data = cache.get(f, cls, columns)
+                if data is not None:
+                    print("Read cached %s file %s" % (cls.filetype,
+                                                      os.path.basename(f)))
+                    yield select.apply(data)
+                else:
+                    yield open_selected(cls, f, columns, select,
+                                        index).read(container)
+                report_drops(cls, f, select)
+        finally:
+            select.bounds = None
+        return
+
+    if cache is None or container is not ColumnData:
+        for data in parse_files(cls, filename, container, jobs, pool,
+                                columns):
+            yield data
+        return
+
+    cached = [cache.get(f, cls, columns) for f in filename]
+    parsed = parse_files(cls, [f for f, d in zip(filename, cached)
+                               if d is None], container, jobs, pool, columns)
+    for f, data in zip(filename, cached):
+        if data is not None:
+            print("Read cached %s file %s" % (cls.filetype,
+                                              os.path.basename(f)))
+        else:
+            data = next(parsed)
+            try:
+                cache.put(f, cls, data, columns)
+            except (IOError, OSError) as e:
+                warnings.warn("Failed to cache '%s': %s" % (f, e))
+        yield data
+
+
+def iter_files(cls, filename, cache=None, columns=None, select=None,
+               index=False, dedup=None):
+    """Parse files with the parser class cls one after another, and yield
+    the data a batch at a time. Only the data sets of the titles in columns
+    are parsed if given.
+
+    If cache (a `ParseCache`) is given, the data of unchanged files are
+    loaded from it block by block, and the other files are cached as they
+    are parsed.
+
+    If select (a `FrameSelection`) is given, only the frames selected are
+    given, and with dedup, the frames overlapping the other files are
+    dropped, like `read_files`.
+    """
+    if dedup and select is None:
+        select = FrameSelection()
+    if select is None:
+        files = [(f, None) for f in filename]
+    else:
+        files = probe_files(cls, filename, select, dedup)
+    for f, bounds in files:
+        if select is not None:
+            if select.finished:
+                break
+            select.bounds = bounds
+        blocks = None if cache is None else cache.iget(f, cls, columns)
+        if blocks is not None:
+            blocks = timed_iter(blocks, 'cache')
+            print("Read cached %s file %s" % (cls.filetype,
+                                              os.path.basename(f)))
+            if select is not None:
+                blocks = (select.apply(data) for data in blocks)
+        elif select is not None:
+            # only the data of all frames are cached
+            blocks = open_selected(cls, f, columns, select,
+                                   index).iter_data()
+        else:
+            blocks = cls(f, columns=columns).iter_data()
+            if cache is not None:
+                blocks = cache.tee(f, cls, blocks, columns=columns)
+        for data in blocks:
+            yield data
+        if select is not None:
+            report_drops(cls, f, select)
+            select.bounds = None
+
+
+def parse_files(cls, filename, container=ColumnData, jobs=1, pool='process',
+                columns=None):
+    """Parse files with the parser class cls and yield the results in the
+    order of filename. The files are parsed concurrently if jobs > 1."""
+    # the members of a compressed archive are read in turn from it
+    if jobs <= 1 or any(map(sequential, filename)):
+        for f in filename:
+            yield cls(f, columns=columns).read(container)
+    elif hasattr(cls, 'split') and not any(is_member(f) or compression(f)
+                                           for f in filename):
+        # a compressed file can't be cut into byte ranges, so it's parsed
+        # by one worker while it's decompressed by a thread of the worker,
+        # and so is a member of an archive
+        for data in read_split_files(cls, filename, container, jobs, pool,
+                                     columns):
+            yield data
+    else:
+        tasks = [(cls, f, container, columns) for f in filename]
+        for data in imap(_read_file, tasks, jobs, pool):
+            yield data
+
+
+def read_split_files(cls, filename, container=ColumnData, jobs=1,
+                     pool='process', columns=None):
+    """Memory-map the files, cut them into byte ranges at newlines, parse
+    the ranges concurrently and yield the results of each file in order.
+    This way even a single huge file keeps all workers busy."""
+    tasks, segments = [], []
     for f in filename:
-        newdata = AmberLogFile(f).read()
-        for k, v in newdata.items():
-            data[k].extend(v)
+        with cls(f, columns=columns) as log:
+            ranges = log.split()
+        tasks.extend((f, s, e, log.titles, container, log.fields)
+                     for s, e in ranges)
+        segments.append((log.titles, log.lineno, len(ranges)))
+
+    results = imap(_read_chunk, tasks, jobs, pool)
+    for titles, lineno, nchunk in segments:
+        data = container(titles)
+        for _ in range(nchunk):
+            chunk, nlines, broken = next(results)
+            if broken:
+                # report the line number in the whole file
+                raise RuntimeError('File broken at line %d' % (lineno+broken))
+            lineno += nlines
+            data.extend(chunk)
+        yield data
+
+
+def merge(results, container=ColumnData):
+    """Concatenate the data of the files."""
+    data = None
+    for newdata in results:
+        if data is None:
+            # no need to copy the data of the first file
+            data = newdata
+        else:
+            with stage('merge'):
+                data.extend(newdata)
+    return container() if data is None else data
+
+
+def required(columns, title):
+    """Return the columns to be parsed with title, if only some are."""
+    if columns is None or title is None:
+        return columns
+    return set(columns) | set([title])
 
-    nframe = len(data['TIME'])
+
+def require(kwargs, title):
+    """Add title to the columns to be parsed if only some are."""
+    kwargs['columns'] = required(kwargs.get('columns'), title)
+
+
+def check_found(data, columns):
+    """Raise ValueError if a data set of columns, the titles asked for if
+    only some are parsed, is not found in data."""
+    for t in columns or ():
+        if t not in data:
+            raise ValueError("Data set '%s' not found." % t)
+
+
+def analyze_amber_log(*filename, **kwargs):
+    """Analyzing Amber mdout file."""
+    asked = kwargs.get('columns')
+    # the frames are counted by TIME
+    require(kwargs, 'TIME')
+    select = kwargs.get('select')
+    if kwargs.get('dedup') or select is not None and select.by == 'step':
+        # the cached data are selected by the steps
+        require(kwargs, 'NSTEP')
+    data = merge(read_files(AmberLogFile, filename, **kwargs),
+                 kwargs.get('container', ColumnData))
+
+    nframe = len(data.get('TIME', ()))
     if nframe == 0:
         raise RuntimeError("No data found.")
+    count('frames', nframe)
+    check_found(data, asked)
 
-    to_del = []
-    for k, v in data.items():
-        if len(v) != nframe:
-            warnings.warn(
-                    "Number of '%s' data frames is not equal to 'NSTEP'. "
-                    "This item is meaningless and will be removed." % k)
-            to_del.append(k)
-    for k in to_del:
-        del data[k]
+    with stage('check'):
+        to_del = []
+        for k, v in data.items():
+            if len(v) != nframe:
+                warnings.warn(
+                        "Number of '%s' data frames is not equal to "
+                        "'NSTEP'. This item is meaningless and will be "
+                        "removed." % k)
+                to_del.append(k)
+        for k in to_del:
+            del data[k]
 
     if len(data) <= 1:
         raise RuntimeError("No data left.")
     return data
 
 
-def analyze_namd_log(*filename):
+def analyze_namd_log(*filename, **kwargs):
     """Analyzing NAMD log file."""
-    data = collections.defaultdict(list)
-    for f in filename:
-        newdata = NamdLogFile(f).read()
-        for k, v in newdata.items():
-            data[k].extend(v)
+    asked = kwargs.get('columns')
+    require(kwargs, 'TS')
+    data = merge(read_files(NamdLogFile, filename, **kwargs),
+                 kwargs.get('container', ColumnData))
+
+    nframe = len(data.get('TS', ()))
+    if nframe == 0:
+        raise RuntimeError("No data found.")
+    count('frames', nframe)
+    check_found(data, asked)
+
+    with stage('check'):
+        to_del = []
+        for k, v in data.items():
+            if len(v) != nframe:
+                warnings.warn(
+                        "Number of '%s' data frames is not equal to 'TS'. "
+                        "This item is meaningless and will be removed." % k)
+                to_del.append(k)
+        for k in to_del:
+            del data[k]
+
+    if len(data) <= 1:
+        raise RuntimeError("No data left.")
+    return data
+
 
-    nframe = len(data['TS'])
+def analyze_log(cls, *filename, **kwargs):
+    """Analyzing the files of a registered parser class cls."""
+    asked = kwargs.get('columns')
+    x = getattr(cls, 'x_title', None)
+    require(kwargs, x)
+    data = merge(read_files(cls, filename, **kwargs),
+                 kwargs.get('container', ColumnData))
+
+    if x is None:
+        x = next(iter(data), None)
+    nframe = len(data.get(x, ()))
     if nframe == 0:
         raise RuntimeError("No data found.")
+    count('frames', nframe)
+    check_found(data, asked)
 
-    to_del = []
-    for k, v in data.items():
-        if len(v) != nframe:
+    with stage('check'):
+        for k in [k for k, v in data.items() if len(v) != nframe]:
             warnings.warn(
-                    "Number of '%s' data frames is not equal to 'TS'. "
-                    "This item is meaningless and will be removed." % k)
-            to_del.append(k)
-    for k in to_del:
-        del data[k]
+                    "Number of '%s' data frames is not equal to '%s'. "
+                    "This item is meaningless and will be removed." % (k, x))
+            del data[k]
 
     if len(data) <= 1:
         raise RuntimeError("No data left.")
     return data
+
+
+def analyze_bin_file(*filename, **kwargs):
+    """Analyzing binary data file."""
+    asked = kwargs.get('columns')
+    # reading these files is as fast as loading the cache
+    kwargs['cache'] = None
+    select = kwargs.get('select')
+    if select is not None and select.by == 'step':
+        for t in STEP_TITLES:
+            require(kwargs, t)
+    data = merge(read_files(BinFile, filename, **kwargs),
+                 kwargs.get('container', ColumnData))
+
+    with stage('check'):
+        lengths = set(len(v) for v in data.values())
+    if not data or lengths == set([0]):
+        raise RuntimeError("No data found.")
+    if len(lengths) != 1:
+        raise RuntimeError("Data sets of different lengths found.")
+    count('frames', lengths.pop())
+    check_found(data, asked)
+    return data
@@ -0,0 +1,193 @@
+"""
+Reading the members of tar archives without extracting them.
+"""
+
+from __future__ import absolute_import
+from collections import OrderedDict
+import fnmatch
+import io
+import os
+import re
+
+from .compressed import BUFFER_SIZE, compression, kind_of, open_stream
+
+__all__ = ['expand_inputs', 'is_member', 'natural_key', 'open_member']
+
+# separator of the archive and the member, or the pattern of the members,
+# in a path like run.tar::*.log
+SEP = '::'
+
+# number of archives kept open, see _archive
+KEEP = 4
+
+_archives = OrderedDict()
+
+
+def natural_key(s):
+    """Sort key of strings with numbers in natural order (run2 < run10)."""
+    return [int(i) if i.isdigit() else i for i in re.split(r'(\d+)', s)]
+
+
+def is_member(path):
+    """Return whether path is of a member of an archive."""
+    return SEP in path
+
+
+def split_member(path):
+    """Return the archive and the member (or pattern) of path."""
+    archive, _, name = path.partition(SEP)
+    return archive, name
+
+
+class _Archive(object):
+    """An archive opened, with its regular members by name."""
+
+    def __init__(self, path, key):
+        # imported here as only some inputs are archives
+        import tarfile
+        self.key = key
+        self.path = path
+        # the data of a compressed archive can only be read forward
+        self.compression = compression(path)
+        self.tar = tarfile.open(path, 'r:*')
+        self.members = OrderedDict((m.name, m) for m in self.tar
+                                   if m.isfile())
+
+    def close(self):
+        self.tar.close()
+
+
+def _archive(path):
+    """Return the opened archive of path, which is kept open with a few
+    others, so the members of an archive are listed only once."""
+    st = os.stat(path)
+    key = (st.st_size, st.st_mtime)
+    path = os.path.abspath(path)
+    archive = _archives.pop(path, None)
+    if archive is not None and archive.key != key:
+        archive.close()
+        archive = None
+    if archive is None:
+        archive = _Archive(path, key)
+    _archives[path] = archive
+    while len(_archives) > KEEP:
+        _archives.popitem(last=False)[1].close()
+    return archive
+
+
+def expand(path):
+    """Return the paths of the members of an archive matching the pattern
+    of path (archive::pattern), in natural order. A pattern without '/'
+    is matched against the base names of the members, and an empty one
+    matches all members."""
+    archive, pattern = split_member(path)
+    names = list(_archive(archive).members)
+    if not pattern:
+        matched = names
+    elif '/' in pattern:
+        matched = fnmatch.filter(names, pattern)
+    else:
+        matched = [n for n in names
+                   if fnmatch.fnmatch(n.rsplit('/', 1)[-1], pattern)]
+    if not matched:
+        raise ValueError("No members of '%s' match '%s'." % (archive,
+                                                              pattern))
+    return [archive + SEP + n for n in sorted(matched, key=natural_key)]
+
+
+def expand_inputs(filename):
+    """Return the files, with the paths of the members of archives
+    (archive::pattern) expanded by `expand`."""
+    files = []
+    for f in filename:
+        if is_member(f):
+            files.extend(expand(f))
+        else:
+            files.append(f)
+    return files
+
+
+def member_info(path):
+    """Return the TarInfo of the member of path."""
+    archive, name = split_member(path)
+    try:
+        return _archive(archive).members[name]
+    except KeyError:
+        raise IOError("No member '%s' in '%s'" % (name, archive))
+
+
+def sequential(path):
+    """Return whether the file has to be read in turn with the other files
+    of its archive, which is so for the members of a compressed archive,
+    whose data are decompressed from the beginning of the archive."""
+    if not is_member(path):
+        return False
+    return _archive(split_member(path)[0]).compression is not None
+
+
+def open_member(path):
+    """Open the member of path for reading in binary mode. Return the file
+    and its compression, or that of the archive if the member can only be
+    read forward, or None.
+
+    A member of an uncompressed archive is read by itself, so the members
+    can be read at the same time, e.g. by a pool of workers. A member which
+    is compressed itself is decompressed as it's read.
+    """
+    archive, name = split_member(path)
+    arc = _archive(archive)
+    info = member_info(path)
+    if arc.compression is None:
+        fp = io.BufferedReader(_Window(io.open(archive, 'rb', buffering=0),
+                                       info.offset_data, info.size),
+                               BUFFER_SIZE)
+    else:
+        fp = arc.tar.extractfile(info)
+    kind = kind_of(fp.peek(6)[:6])
+    if kind is not None:
+        # not decompressed ahead by a thread, which would read the archive
+        # shared by the members
+        return open_stream(fp, kind, ahead=0), kind
+    return fp, arc.compression
+
+
+class _Window(io.RawIOBase):
+    """The bytes [start, start+size) of a raw file, as a file."""
+
+    def __init__(self, fp, start, size):
+        super(_Window, self).__init__()
+        self.fp = fp
+        self.start = start
+        self.size = size
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        n = min(len(b), self.size-self.pos)
+        if n <= 0:
+            return 0
+        self.fp.seek(self.start+self.pos)
+        n = self.fp.readinto(memoryview(b)[:n])
+        self.pos += n
+        return n
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.pos
+        elif whence == 2:
+            offset += self.size
+        self.pos = max(0, offset)
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def close(self):
+        if not self.closed:
+            self.fp.close()
+        super(_Window, self).close()
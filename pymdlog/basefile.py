@@ -5,6 +5,10 @@ Base file objects.
 from __future__ import absolute_import, print_function
 import os
 
+from .archive import is_member, open_member, split_member
+from .compressed import compressed_tell, compression, open_compressed
+from .progress import watch
+
 __all__ = ['ReadOnlyTextFile', 'TextFile']
 
 
@@ -20,6 +24,7 @@ class BaseFile(object):
             raise ValueError("Require mode %s" % ", ".join(self.modes))
 
         self.fp = self.open(filename, mode)
+        self.filepath = filename
         self.filename = os.path.basename(filename)
 
     def __del__(self):
@@ -72,3 +77,190 @@ class ReadOnlyTextFile(BaseFile):
     """Class with method to read text files."""
     modes = {'r': 'r'}
     read = iread
+    # position after the last complete line given by read_appended
+    offset = 0
+    # pattern of a step number at the beginning of a frame, used by probe
+    # and the step index
+    pat_step = None
+    # frames selected (a FrameSelection), whether a step index is used to
+    # seek to them, the index and the offset from which no frames are
+    # selected, found by the index
+    select = None
+    use_index = False
+    index = None
+    limit = None
+    # compression of the file ('gzip', 'bz2' or 'xz'), or of its archive
+    # if it's a member read forward only, or None
+    compression = None
+    # the archive of the file if it's a member (archive::member)
+    archive = None
+
+    def __init__(self, filename, mode='r'):
+        super(ReadOnlyTextFile, self).__init__(filename, mode)
+        # for the progress of parsing the files, if watched
+        watch(self)
+
+    def position(self):
+        """Return the bytes of the file read, counted in the compressed
+        data if it's compressed, or None if unknown. It's called by other
+        threads to show the progress of parsing, see `Progress`."""
+        fp = self.fp
+        if fp is None:
+            return None
+        try:
+            if self.compression is None:
+                return fp.tell()
+            if self.archive is None:
+                return compressed_tell(fp)
+        except (ValueError, IOError, OSError):
+            # closed by the parser
+            pass
+        return None
+
+    def open(self, filename, mode='r', *args, **kwargs):
+        """Open the file, which is decompressed as it's read if it's
+        compressed (detected by the magic bytes) and opened in binary mode.
+        A compressed file can only be read forward.
+
+        A member of a tar archive is given as archive::member, see
+        `archive.open_member`.
+        """
+        if 'b' in mode and is_member(filename):
+            self.archive = split_member(filename)[0]
+            fp, self.compression = open_member(filename)
+            return fp
+        # a pipe can't be sniffed without taking the bytes from the parser
+        if 'b' in mode and os.path.isfile(filename):
+            self.compression = compression(filename)
+            if self.compression is not None:
+                return open_compressed(filename, self.compression)
+        return super(ReadOnlyTextFile, self).open(filename, mode, *args,
+                                                  **kwargs)
+
+    def seek_selected(self):
+        """Seek to the last indexed frame before the frames selected, and
+        find the limit after them, if a step index is used. Return True if
+        the file is sought, in which case the frames skipped are counted by
+        select, and lineno is the number of lines skipped."""
+        # the frames dropped for overlapping other files (see
+        # FrameSelection.bounds) are all read to be counted, a compressed
+        # file can't be sought, and no index is kept of a member
+        if (not self.use_index or self.select is None or
+                self.select.bounds is not None or
+                self.compression is not None or self.archive is not None):
+            return False
+        if self.index is None:
+            # imported here as it's only used with --index
+            from .stepindex import StepIndex
+            self.index = StepIndex.open(self)
+        before, self.limit = self.index.find(self.select)
+        if before is None or before[0] <= self.fp.tell():
+            return False
+        offset, nframe, self.lineno = before
+        self.fp.seek(offset)
+        self.select.skip(nframe)
+        return True
+
+    def iter_lines(self):
+        """Iterate over the lines of the file up to limit if any."""
+        if self.limit is None:
+            return iter(self.fp)
+        return self._lines_before(self.limit)
+
+    def _lines_before(self, limit):
+        pos = self.fp.tell()
+        for line in iter(self.fp.readline, b''):
+            if pos >= limit:
+                break
+            pos += len(line)
+            yield line
+
+    def reached_limit(self):
+        """Return whether the file is read up to limit."""
+        return self.limit is not None and self.fp.tell() >= self.limit
+
+    def probe(self, size=1 << 16, scan=True):
+        """Return the first and last steps of the file, or None if not
+        found. They are looked for size bytes at a time from the beginning
+        and from the end, so usually only the head and the tail are read.
+        It's used to skip the files out of a range of steps and to find the
+        overlaps of files without parsing them. The file has to be opened
+        in binary mode.
+
+        A compressed file is decompressed as a whole to find the last step,
+        unless scan is False, in which case None is given for it.
+        """
+        if self.pat_step is None:
+            return None
+        if self.compression is not None:
+            return self._probe_stream(size) if scan else None
+        fp = self.fp
+        pos = fp.tell()
+        try:
+            # the size of a member as well
+            fp.seek(0, 2)
+            end = fp.tell()
+            first = None
+            offset = 0
+            while first is None and offset < end:
+                fp.seek(offset)
+                block = fp.read(size)
+                first = self.pat_step.search(block)
+                # the next block begins with a complete line
+                offset += block.rfind(b'\n') + 1 or len(block)
+            last = None
+            stop = end
+            while first is not None and last is None and stop > 0:
+                offset = max(0, stop-size)
+                fp.seek(offset)
+                block = fp.read(stop-offset)
+                # the first line may be incomplete
+                begin = block.find(b'\n') + 1 if offset else 0
+                for last in self.pat_step.finditer(block, begin):
+                    pass
+                stop = offset + begin if 0 < begin < len(block) else offset
+        finally:
+            fp.seek(pos)
+        if first is None or last is None:
+            return None
+        return int(first.group(1)), int(last.group(1))
+
+    def _probe_stream(self, size):
+        # the file is read once from the beginning, and put back after
+        first = last = None
+        for block in iter(lambda: self.fp.read(size), b''):
+            if not block.endswith(b'\n'):
+                block += self.fp.readline()
+            for m in self.pat_step.finditer(block):
+                if first is None:
+                    first = m
+                last = m
+        self.fp.close()
+        self.fp = self.open(self.filepath, self.modes[self.mode])
+        if first is None:
+            return None
+        return int(first.group(1)), int(last.group(1))
+
+    def read_appended(self, size=1 << 22):
+        """Yield lists of about size bytes of the complete lines appended
+        to the file since the last call, which is used to follow a growing
+        file. The file has to be opened in binary mode."""
+        if self.compression is not None or self.archive is not None:
+            raise RuntimeError("Can't follow compressed or archived file "
+                               "%s." % self.filename)
+        if os.fstat(self.fp.fileno()).st_size < self.offset:
+            raise RuntimeError("File %s has been truncated." % self.filename)
+        self.fp.seek(self.offset)
+        while True:
+            lines = self.fp.readlines(size)
+            if not lines:
+                break
+            # the last line may be still being written
+            partial = not lines[-1].endswith(b'\n')
+            if partial:
+                lines.pop()
+            self.offset += sum(len(line) for line in lines)
+            if lines:
+                yield lines
+            if partial:
+                break
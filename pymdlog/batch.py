@@ -0,0 +1,206 @@
+"""
+Batch analysis of many independent runs.
+"""
+
+from __future__ import absolute_import, print_function
+import glob
+import os
+import sys
+import warnings
+
+from .analysis import LogAnalyzer, imap
+from .archive import natural_key
+from .basefile import iwrite
+from .binfile import BinFile
+from .compressed import SUFFIXES
+from .csvfile import CsvFile
+from .registry import AUTO, get_parser, parser_types, sniff
+from .selection import FrameSelection
+from .stats import ITEMS, calc_stats, ineff_method
+
+__all__ = ['find_runs', 'run_batch', 'save_table']
+
+# the items of ITEMS which are numbers, in the binary table
+NUMBERS = [i for i in ITEMS[1:] if not i.startswith('CI95%')]
+
+
+def find_runs(paths, type, pattern=None):
+    """Return (name, files) of the runs in paths, each of which is a
+    directory of log files matching pattern (default: the pattern of the
+    parser of type), sorted in natural order, a single log file, or the
+    members of an archive (archive::pattern, see `archive.expand`).
+
+    If type is auto, the files matching the pattern of any parser are
+    found, of which those whose type can't be detected (like stats.log)
+    are left out unless pattern is given. The default patterns match the
+    compressed files too, like md.log.gz.
+    """
+    if pattern:
+        patterns = [pattern]
+    elif type == AUTO:
+        patterns = set(getattr(get_parser(t), 'pattern', None)
+                       for t in parser_types())
+        patterns.discard(None)
+    else:
+        patterns = [getattr(get_parser(type), 'pattern', '*')]
+    if not pattern:
+        patterns = [p + s for p in patterns for s in ('',) + SUFFIXES]
+    runs = []
+    for path in paths:
+        name = path.rstrip('/\\') or path
+        if os.path.isdir(path):
+            files = set()
+            for p in patterns:
+                files.update(glob.glob(os.path.join(path, p)))
+            if type == AUTO and not pattern:
+                files = [f for f in files if sniff(f) is not None]
+            files = sorted(files, key=natural_key)
+        else:
+            files = [path]
+        runs.append((name, files))
+    return runs
+
+
+class _Quiet(object):
+    """Discard the messages of the parsers of a run."""
+
+    def write(self, s):
+        pass
+
+    def flush(self):
+        pass
+
+
+def analyze_run(task):
+    """Return (name, statistical results, error, warnings) of a run, run in
+    the pool workers. Any error of the run is given instead of raised, so
+    the other runs go on."""
+    type, name, files, cache, x, y, selection, dedup = task
+    stdout = sys.stdout
+    sys.stdout = _Quiet()
+    try:
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            try:
+                if not files:
+                    raise RuntimeError("No log files found.")
+                select = None
+                if selection is not None:
+                    select = FrameSelection(**selection)
+                ana = LogAnalyzer(type, cache=cache)
+                detected = ana.detect(files)
+                x = x or getattr(detected[1], 'x_title', None)
+                columns = [x] + y if x and y else None
+                data = ana.analyze(*files, columns=columns, select=select,
+                                   dedup=dedup, detected=detected)
+                if x is None:
+                    x = next(iter(data))
+                for i in y:
+                    if i not in data:
+                        raise ValueError("Data set '%s' not found." % i)
+                ylbs = y if y else [i for i in data if i != x]
+                values = calc_stats(ylbs, [data[i] for i in ylbs])
+                error = None
+            except Exception as e:
+                values = None
+                error = '%s: %s' % (e.__class__.__name__, e)
+        return name, values, error, [str(w.message) for w in caught]
+    finally:
+        sys.stdout = stdout
+
+
+def run_batch(type, runs, jobs=1, cache=None, x=None, y=None,
+              selection=None, dedup=None, progress=None):
+    """Compute the statistical results of each of the runs, (name, files)
+    like those of `find_runs`, which are analyzed by a pool of jobs
+    processes. Return (name, results, error, warnings) of the runs in
+    order, with either the results (in the order of ITEMS) of the y data
+    sets (default: all but x) or the error of a run.
+
+    selection is a dict of the arguments of the `FrameSelection` of each
+    run, and dedup the policy of the overlaps of its files, see
+    `LogAnalyzer.analyze`. progress is called with the number of runs done,
+    the total and the result of each run as it's done.
+    """
+    tasks = [(i, (type, name, files, cache, x, list(y or ()), selection,
+                  dedup)) for i, (name, files) in enumerate(runs)]
+    if jobs > 1:
+        results = imap(_analyze_run, tasks, jobs, ordered=False)
+    else:
+        results = (_analyze_run(task) for task in tasks)
+    done = [None] * len(tasks)
+    for ndone, (i, result) in enumerate(results, 1):
+        done[i] = result
+        if progress is not None:
+            progress(ndone, len(tasks), result)
+    return done
+
+
+def _analyze_run(args):
+    # the results are done in any order, so they are given with the index
+    i, task = args
+    return i, analyze_run(task)
+
+
+def print_progress(ndone, total, result):
+    """Print a line of the result of a run, for run_batch."""
+    name, values, error, caught = result
+    if error is None:
+        status = '%d data sets' % len(values)
+    else:
+        status = 'FAILED %s' % error
+    if caught:
+        status += ', %d warnings' % len(caught)
+    print('[%d/%d] %s: %s' % (ndone, total, name, status))
+
+
+def save_table(results, fname):
+    """Save the results of run_batch in one table with a row per run and
+    data set. The file type is by extension: .csv for CSV, .pmd for
+    binary with a row per run and a column per data set and item (NaN for
+    failed runs), and simple text for others."""
+    ext = fname.lower()
+    if ext.endswith('.pmd'):
+        titles, columns = ['Run'], [list(range(len(results)))]
+        index = {}
+        for i, (_, values, _, _) in enumerate(results):
+            for v in values or ():
+                for item, value in zip(ITEMS[1:], v[1:]):
+                    if item not in NUMBERS:
+                        continue
+                    t = '%s %s' % (v[0], item)
+                    if t not in index:
+                        index[t] = len(columns)
+                        titles.append(t)
+                        columns.append([float('nan')] * len(results))
+                    columns[index[t]][i] = value
+        out = BinFile(fname, 'w')
+        out.write(*columns, titles=titles)
+        out.close()
+        return
+
+    if ext.endswith('.csv'):
+        rows = [('Run',) + ITEMS + ('Error',)]
+        for name, values, error, _ in results:
+            if error is not None:
+                rows.append((name,) + ('',)*len(ITEMS) + (error,))
+            for v in values or ():
+                rows.append((name,) + tuple(v) + ('',))
+        out = CsvFile(fname, 'w')
+        iwrite(out)
+        out.write_rows(rows)
+        out.close()
+        return
+
+    # like stats.log, with the failed runs noted first
+    print('Write batch results file %s' % fname)
+    fmt = '"%s" "%s"' + ' %s'*(len(ITEMS)-1) + '\n'
+    with open(fname, 'w') as f:
+        for name, _, error, _ in results:
+            if error is not None:
+                f.write('# %s: %s\n' % (name, error))
+        f.write('# Ineff: estimated from the %s\n' % ineff_method())
+        f.write(' '.join(('Run',) + ITEMS)+'\n')
+        for name, values, _, _ in results:
+            for v in values or ():
+                f.write(fmt % ((name,) + tuple(v)))
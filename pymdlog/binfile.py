@@ -0,0 +1,72 @@
+"""
+Module to read and write binary columnar data files.
+"""
+
+from __future__ import absolute_import
+
+from .basefile import BaseFile, iread, iwrite
+from .columns import MAGIC, ColumnData, dump_columns
+from .profiling import count, stage, timed
+
+__all__ = ['BinFile']
+
+
+class BinFile(BaseFile):
+    """Read and write binary columnar data files.
+
+    The file begins with a magic string, the length of the header as a
+    little-endian uint32 and the header in JSON, which lists the title,
+    the dtype ('<f8' or '<i8') and the length of every column. The columns
+    follow one after another as raw little-endian numbers, so they can also
+    be loaded with `numpy.fromfile`.
+    """
+    filetype = "binary columnar data"
+    modes = {'r': 'rb', 'w': 'wb'}
+    # the first data set is the default x, see registry
+    x_title = step_title = None
+    pattern = '*.pmd'
+
+    def __init__(self, filename, mode='r', columns=None, select=None):
+        # only the columns of these titles are read, and only the frames
+        # kept by select (a FrameSelection) are given, if given
+        super(BinFile, self).__init__(filename, mode)
+        self.columns = columns
+        self.select = select
+
+    @classmethod
+    def sniff(cls, head):
+        """Return whether head, the first bytes of a file, are of a binary
+        data file."""
+        return head.startswith(MAGIC)
+
+    @timed('write')
+    def write(self, xdat, *ydat, **kwargs):
+        """Write a single-x-multiple-y file.
+        kwargs: titles, the titles of x and y (default: X, Y1, Y2, ...)
+        """
+        iwrite(self)
+
+        # sanity check
+        xlen = len(xdat)
+        for i, d in enumerate(ydat):
+            ylen = len(d)
+            if xlen != ylen:
+                raise ValueError("$%d x=%d y=%d" % (i, xlen, ylen))
+
+        titles = kwargs.get('titles') or \
+            ['X'] + ['Y%d' % (i+1) for i in range(len(ydat))]
+        dump_columns(self.fp, titles, (xdat,) + ydat)
+
+    def read(self, container=ColumnData):
+        """Read a binary file into container (default: `ColumnData`)."""
+        iread(self)
+        with stage('read'):
+            data = ColumnData.load(self.fp, self.columns)
+        count('bytes read', self.fp.tell())
+        if self.select is not None:
+            data = self.select.apply(data)
+        if container is ColumnData:
+            return data
+        newdata = container()
+        newdata.extend(data)
+        return newdata
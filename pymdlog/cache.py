@@ -0,0 +1,251 @@
+"""
+On-disk cache of parsed log files.
+"""
+
+from __future__ import absolute_import
+import os
+import warnings
+
+from .archive import is_member, member_info, split_member
+from .columns import ColumnData
+from .profiling import timed
+
+__all__ = ['ParseCache']
+
+# bytes of the beginning of a file hashed into the key
+HASH_SIZE = 1 << 16
+
+# default limit of the total size of the cache, in bytes
+MAX_SIZE = 1 << 30
+
+SUFFIX = '.pmc'
+
+
+def default_directory():
+    """Return the default cache directory of the platform."""
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA', os.path.expanduser('~'))
+    else:
+        base = os.environ.get('XDG_CACHE_HOME',
+                              os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(base, 'pymdlog')
+
+
+class ParseCache(object):
+    """Cache the data parsed from log files as binary `ColumnData` files.
+
+    An entry is keyed by the parser, the absolute path, the size, the
+    modification time and a hash of the first bytes of a log file, so it
+    is invalidated as soon as the file changes. The data of only some
+    columns are kept apart from the data of all columns, which can be used
+    for them as well. When the total size of the entries exceeds max_size,
+    the least recently used ones are removed.
+    """
+
+    def __init__(self, directory=None, max_size=MAX_SIZE):
+        self.directory = directory or default_directory()
+        self.max_size = max_size
+        self._size = None
+
+    def key(self, filename, parser, columns=None):
+        """Return the key of the file parsed by the parser class, only for
+        the columns of the titles in columns if given.
+
+        A member of an archive (archive::member) is keyed by the archive
+        and the header of the member instead of the first bytes, which may
+        only be read by decompressing the archive up to them.
+        """
+        import hashlib
+        archive, member = split_member(filename)
+        st = os.stat(archive)
+        h = hashlib.sha1()
+        h.update(('%s\0%s\0%d\0%r\0' % (
+                  parser.__name__, os.path.abspath(archive), st.st_size,
+                  st.st_mtime)).encode('utf-8'))
+        if columns is not None:
+            h.update(('\0'.join(sorted(columns)) + '\0').encode('utf-8'))
+        if is_member(filename):
+            info = member_info(filename)
+            h.update(('%s\0%d\0%r\0%d\0' % (
+                      member, info.size, info.mtime,
+                      info.chksum)).encode('utf-8'))
+        else:
+            with open(filename, 'rb') as f:
+                h.update(f.read(HASH_SIZE))
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + SUFFIX)
+
+    @timed('cache')
+    def get(self, filename, parser, columns=None):
+        """Return the cached data of the file, or None if not cached."""
+        blocks = self.iget(filename, parser, columns)
+        if blocks is None:
+            return None
+        data = None
+        try:
+            for block in blocks:
+                if data is None:
+                    data = block
+                else:
+                    data.extend(block)
+        except RuntimeError:
+            return None
+        return data
+
+    def iget(self, filename, parser, columns=None):
+        """Return an iterator of the blocks of the cached data of the file,
+        or None if not cached."""
+        paths = [self.path(self.key(filename, parser, columns))]
+        if columns is not None:
+            # the data of all columns will do as well
+            paths.append(self.path(self.key(filename, parser)))
+        for path in paths:
+            try:
+                f = open(path, 'rb')
+            except (IOError, OSError):
+                continue
+            try:
+                # mark it as recently used
+                os.utime(path, None)
+            except OSError:
+                pass
+            return self._blocks(f, path, columns)
+        return None
+
+    def _blocks(self, f, path, columns=None):
+        with f:
+            try:
+                n = 0
+                for n, data in enumerate(ColumnData.iter_load(f, columns), 1):
+                    yield data
+                if not n:
+                    raise RuntimeError
+            except Exception:
+                # a broken entry
+                f.close()
+                self._remove(path)
+                raise RuntimeError("Broken cache entry '%s'" % path)
+
+    @timed('cache')
+    def put(self, filename, parser, data, columns=None):
+        """Cache the data of the file, which are of the titles in columns
+        if given."""
+        for _ in self.tee(filename, parser, [data], True, columns):
+            pass
+
+    def tee(self, filename, parser, blocks, strict=False, columns=None):
+        """Yield the blocks of data of the file, which are cached as they
+        pass by, so a file parsed batch by batch can be cached without
+        keeping its data. The entry is only added after the last block.
+
+        Unless strict, a failure to write the cache is given as a warning,
+        and the blocks keep coming.
+        """
+        entry = None
+        try:
+            entry = _Entry(self, self.path(self.key(filename, parser,
+                                                    columns)))
+        except (IOError, OSError) as e:
+            if strict:
+                raise
+            warnings.warn("Failed to cache '%s': %s" % (filename, e))
+        try:
+            for data in blocks:
+                if entry is not None:
+                    try:
+                        data.dump(entry.fp)
+                    except (IOError, OSError) as e:
+                        entry.abort()
+                        entry = None
+                        if strict:
+                            raise
+                        warnings.warn("Failed to cache '%s': %s" % (
+                                      filename, e))
+                yield data
+            if entry is not None:
+                try:
+                    entry.commit()
+                except (IOError, OSError) as e:
+                    entry.abort()
+                    entry = None
+                    if strict:
+                        raise
+                    warnings.warn("Failed to cache '%s': %s" % (filename, e))
+        except BaseException:
+            # including the generator being closed before the last block
+            if entry is not None:
+                entry.abort()
+            raise
+        if entry is not None:
+            if self._size is not None:
+                self._size += os.path.getsize(entry.path)
+            self.evict()
+
+    def entries(self):
+        """Return (mtime, size, path) of the entries, oldest first."""
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        entries.sort()
+        return entries
+
+    def evict(self):
+        """Remove the least recently used entries until the total size is
+        within the limit."""
+        if self._size is not None and self._size <= self.max_size:
+            return
+        entries = self.entries()
+        self._size = sum(e[1] for e in entries)
+        for _, size, path in entries:
+            if self._size <= self.max_size:
+                break
+            self._remove(path)
+            self._size -= size
+
+    def clear(self):
+        """Remove all entries."""
+        for _, _, path in self.entries():
+            self._remove(path)
+        self._size = 0
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class _Entry(object):
+    """A cache entry being written to a temporary file, which is renamed
+    when completed, so that other processes never see a partially written
+    entry."""
+
+    def __init__(self, cache, path):
+        import tempfile
+        if not os.path.isdir(cache.directory):
+            os.makedirs(cache.directory)
+        self.cache = cache
+        self.path = path
+        fd, self.tmp = tempfile.mkstemp(dir=cache.directory, suffix='.tmp')
+        self.fp = os.fdopen(fd, 'wb')
+
+    def commit(self):
+        self.fp.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        os.rename(self.tmp, self.path)
+
+    def abort(self):
+        self.fp.close()
+        self.cache._remove(self.tmp)
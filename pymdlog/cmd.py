@@ -4,46 +4,40 @@ Command line module.
 
 from __future__ import absolute_import, print_function
 from argparse import ArgumentParser
+import os
 import sys
-
-try:
-    import matplotlib.pyplot as plt
-except ImportError:
-    HAS_PLOTLIB = False
-else:
-    HAS_PLOTLIB = True
-
-    def save_plots(x, ys, xlb, ylbs, figname):
-        """Plot multiple 2D line/point figures, which share a x-axis."""
-        print('Generate figure %s' % figname)
-        plt.close('all')
-        n = len(ylbs)
-        if n == 1:  # single plot
-            _, ax = plt.subplots()
-            ax.plot(x, ys[0], 'k-')
-            ax.set_ylabel(ylbs[0])
-        else:       # multiple plots
-            _, axs = plt.subplots(n, sharex=True)
-            for ax, y, ylb in zip(axs, ys, ylbs):
-                ax.plot(x, y, 'k-')
-                ax.set_ylabel(ylb)
-        ax.set_xlabel(xlb)
-        plt.savefig(figname, dpi=300)
+import time
 
 from . import __program__ as NAME, __version__ as VER
-from .gui import run_gui
 from .analysis import LogAnalyzer
+from .archive import expand_inputs
+from .basefile import iwrite
+from .binfile import BinFile
+from .cache import ParseCache
+from .columns import STEP_TITLES
 from .datfile import DatFile
 from .csvfile import CsvFile
-from .stats import calc_stats, save_stats
+from .equilibration import trim_equilibration
+from .pipeline import FrameBuffer, IncompleteFrames, stream
+from .profiling import Profile, count, timed
+from .reduction import METHODS, PLOT_POINTS, downsample, reduce_data
+from .registry import detect
+from .selection import BY, POLICIES, FrameSelection
+from .stats import BLOCKING, StatsCollector, calc_stats, save_stats
 
 
 def main():
     """Parse the command line arguments."""
     # enter GUI mode if no arguments given
     if len(sys.argv) == 1:
+        # tkinter and matplotlib are only imported when they are used, as
+        # it takes a while, especially on network file systems
+        from .gui import run_gui
         run_gui()
         return
+    if sys.argv[1] == 'batch':
+        batch_main(sys.argv[2:])
+        return
 
     parser = ArgumentParser(prog=NAME.lower(), add_help=False,
                             description='These arguments are used in the '
@@ -60,17 +54,25 @@ def main():
                        version='%s, Version %s'%(NAME, VER))
 
     group.add_argument('-i', '--input', dest='inploc', nargs='+',
-                       help='Specify the input MD log file location(s). '
-                            '[required]')
+                       help='Specify the input MD log file location(s), '
+                            'or ARCHIVE::PATTERN for the members of a tar '
+                            'archive matching PATTERN. [required]')
 
-    parser.add_argument('-t', '--type', dest='inptype',
-                        choices=['amber', 'namd'], default='amber',
-                        help='Specify the input MD log file type. '
-                             '[default: %(default)s]')
+    group.add_argument('--clear-cache', dest='clear_cache',
+                       action='store_true',
+                       help='Remove the cached data of parsed files and '
+                            'exit.')
+
+    parser.add_argument('-t', '--type', dest='inptype', default='auto',
+                        help='Specify the input MD log file type, amber, '
+                             'namd, binary or one registered by another '
+                             'package, or auto to detect it by the content '
+                             'of the files. [default: %(default)s]')
 
     parser.add_argument('-x', '--xaxis', dest='x',
                         help='Specify the x-axis data set. '
-                             '[default: TIME for Amber, TS for NAMD]')
+                             '[default: TIME for Amber, TS for NAMD, the '
+                             'first one for binary]')
 
     parser.add_argument('-y', '--yaxis', dest='y', nargs='+',
                         help='Specify the y-axis data set(s). '
@@ -78,7 +80,8 @@ def main():
 
     parser.add_argument('-o', '--output', dest='outloc', default='output.dat',
                         help='Specify the output result file location. The '
-                             'file type is extension-detected. '
+                             'file type is extension-detected, .csv for CSV, '
+                             '.pmd for binary and simple text for others. '
                              '[default: %(default)s]')
 
     parser.add_argument('-f', '--figure', dest='figloc',
@@ -90,41 +93,478 @@ def main():
                         help='Do not output statistical results. '
                              '[default: %(default)s]')
 
+    add_selection_arguments(parser)
+
+    parser.add_argument('--index', action='store_true',
+                        help='Keep a step index of each input log file '
+                             '(FILE.pmi), which is extended as the file '
+                             'grows, to seek to the frames of START and '
+                             'STOP instead of reading from the beginning. '
+                             '[default: %(default)s]')
+
+    parser.add_argument('--auto-equil', dest='auto_equil',
+                        action='store_true',
+                        help='Detect the end of the equilibration phase in '
+                             'the y-axis data sets, and remove the frames '
+                             'before it from all data sets. '
+                             '[default: %(default)s]')
+
+    parser.add_argument('--window', dest='window', type=int,
+                        help='Replace the y-axis data sets with their '
+                             'rolling mean and SD over WINDOW frames in the '
+                             'output file and figure.')
+
+    parser.add_argument('--max-points', dest='max_points', type=int,
+                        help='Keep at most MAX_POINTS frames in the output '
+                             'file and figure. [default: all frames in the '
+                             'output file, %d in the figure]' % PLOT_POINTS)
+
+    parser.add_argument('--downsample', dest='downsample',
+                        choices=sorted(METHODS), default='lttb',
+                        help='Specify how the frames are chosen when there '
+                             'are more than MAX_POINTS: lttb and minmax keep '
+                             'the peaks, stride keeps every n-th frame. '
+                             '[default: %(default)s]')
+
+    parser.add_argument('--nostream', action='store_true',
+                        help='Keep all data in memory. By default, the '
+                             'frames are streamed from the input files to '
+                             'the output file unless a figure, the '
+                             'equilibration detection, the data reduction, '
+                             'a binary output file or JOBS > 1 is asked '
+                             'for, which need the whole data. Only then, '
+                             'and with numpy, the inefficiency (Ineff, '
+                             'SEM(corr)) is computed from the '
+                             'autocorrelation instead of block averages. '
+                             '[default: %(default)s]')
+
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=1,
+                        help='Specify the number of input files parsed at '
+                             'the same time. [default: %(default)s]')
+
+    parser.add_argument('--pool', dest='pool', choices=['process', 'thread'],
+                        default='process',
+                        help='Specify the type of workers used when JOBS > '
+                             '1. [default: %(default)s]')
+
+    parser.add_argument('--nocache', action='store_true',
+                        help='Do not use or update the cached data of '
+                             'parsed files. [default: %(default)s]')
+
+    parser.add_argument('--follow', dest='follow', nargs='?', type=float,
+                        const=5.0, metavar='SECONDS',
+                        help='Keep following the input files of a running '
+                             'simulation, and update the output and '
+                             'statistical results with the new data every '
+                             'SECONDS (default: %(const)s) until Ctrl-C is '
+                             'pressed.')
+
+    add_profile_argument(parser)
+
+    args = parser.parse_args()
+    if args.clear_cache:
+        ParseCache().clear()
+        return
+
     # command-line mode
-    run_cmd(parser.parse_args())
+    profiled(run_cmd, args)
+
+
+def add_selection_arguments(parser):
+    """Add the arguments of the frames used."""
+    parser.add_argument('--start', dest='start', type=parse_step,
+                        help='Only use the frames from START on, a step or '
+                             'a frame index (see BY).')
+
+    parser.add_argument('--stop', dest='stop', type=parse_step,
+                        help='Only use the frames before STOP, a step or a '
+                             'frame index (see BY).')
+
+    parser.add_argument('--stride', dest='stride', type=int, default=1,
+                        help='Only use every STRIDE-th frame from START on. '
+                             '[default: %(default)s]')
+
+    parser.add_argument('--by', dest='by', choices=BY, default='step',
+                        help='Specify whether START and STOP are steps (TS '
+                             'or NSTEP) or frame indices counting from 0 '
+                             'over all input files. The frames out of the '
+                             'range are skipped while parsing, and so are '
+                             'the input files out of the range of steps. '
+                             '[default: %(default)s]')
+
+    parser.add_argument('--dedup', dest='dedup', choices=POLICIES,
+                        help='Take the input log files as segments of a '
+                             'run in order, and drop the frames of the '
+                             'steps found in more than one of them, keeping '
+                             'the first or the last of the overlapping '
+                             'frames. The frames dropped are noted in the '
+                             'stats file.')
+
+
+def add_profile_argument(parser):
+    """Add the argument of the profile report."""
+    parser.add_argument('--profile', dest='profile', nargs='?', const='-',
+                        metavar='FILE',
+                        help='Time the stages of the run (reading, '
+                             'parsing, statistics, writing...) and count '
+                             'the bytes, lines, values and frames parsed, '
+                             'and write the report to FILE, in JSON if it '
+                             'ends with .json, or print it if no FILE is '
+                             'given.')
+
+
+def profiled(func, args):
+    """Run func(args), profiled if asked for by --profile, whose report is
+    given even if it fails."""
+    if not args.profile:
+        func(args)
+        return
+    profile = Profile()
+    try:
+        with profile:
+            func(args)
+    finally:
+        profile.save(args.profile)
+
+
+def batch_main(argv):
+    """Parse the command line arguments of the batch mode."""
+    parser = ArgumentParser(prog='%s batch' % NAME.lower(),
+                            description='Compute the statistical results '
+                                        'of many independent runs at the '
+                                        'same time, and write them in one '
+                                        'table.')
+
+    parser.add_argument('runs', nargs='+', metavar='RUN',
+                        help='Specify the runs, each a directory of MD log '
+                             'files (see PATTERN) or a single log file.')
+
+    parser.add_argument('-t', '--type', dest='inptype', default='auto',
+                        help='Specify the input MD log file type, amber, '
+                             'namd, binary or one registered by another '
+                             'package, or auto to detect it by the content '
+                             'of the files. [default: %(default)s]')
+
+    parser.add_argument('-p', '--pattern', dest='pattern',
+                        help='Specify the pattern of the log files of a run '
+                             'directory, which are taken in natural order. '
+                             '[default: *.out for Amber, *.log for NAMD, '
+                             '*.pmd for binary, and the files of any type '
+                             'detected for auto]')
+
+    parser.add_argument('-x', '--xaxis', dest='x',
+                        help='Specify the x-axis data set, which is left '
+                             'out. [default: TIME for Amber, TS for NAMD, '
+                             'the first one for binary]')
+
+    parser.add_argument('-y', '--yaxis', dest='y', nargs='+',
+                        help='Specify the data set(s) of the statistical '
+                             'results. [default: all data sets found '
+                             'except X]')
+
+    parser.add_argument('-o', '--output', dest='outloc', default='batch.csv',
+                        help='Specify the output table location, with a row '
+                             'per run and data set. The file type is '
+                             'extension-detected, .csv for CSV, .pmd for '
+                             'binary (a row per run) and simple text for '
+                             'others. [default: %(default)s]')
+
+    add_selection_arguments(parser)
+
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int,
+                        help='Specify the number of runs analyzed at the '
+                             'same time. [default: the number of CPUs]')
+
+    parser.add_argument('--nocache', action='store_true',
+                        help='Do not use or update the cached data of '
+                             'parsed files. [default: %(default)s]')
+
+    add_profile_argument(parser)
+
+    args = parser.parse_args(argv)
+    profiled(batch_cmd, args)
+
+
+def batch_cmd(args):
+    """Batch mode: analyze the runs by a pool of processes, and write the
+    statistical results of all of them in one table. The failed runs are
+    reported and left out, without stopping the others."""
+    from .batch import find_runs, print_progress, save_table
+    if args.jobs is None:
+        from multiprocessing import cpu_count
+        args.jobs = cpu_count()
+    cache = None if args.nocache else ParseCache()
+    ana = LogAnalyzer(args.inptype, args.jobs, cache=cache)
+    select = frame_selection(args)
+    selection = None
+    if select is not None:
+        selection = dict(start=select.start, stop=select.stop,
+                         stride=select.stride, by=select.by)
+    runs = find_runs(args.runs, args.inptype, args.pattern)
+    print('Analyze %d runs with %d jobs' % (len(runs), args.jobs))
+    results = ana.analyze_batch(runs, x=args.x, y=args.y,
+                                selection=selection, dedup=args.dedup,
+                                progress=print_progress)
+    save_table(results, args.outloc)
+    failed = [r[0] for r in results if r[2] is not None]
+    if failed:
+        print('%d of %d runs failed: %s' % (len(failed), len(runs),
+                                             ' '.join(failed)))
+
+
+def parse_step(s):
+    """Convert a step or frame index, which may be given like 1e6."""
+    return int(float(s))
+
+
+def frame_selection(args):
+    """Return the `FrameSelection` of the arguments, or None if all frames
+    are used."""
+    if (args.start is None and args.stop is None and args.stride == 1 and
+            not args.dedup):
+        return None
+    return FrameSelection(args.start, args.stop, args.stride, args.by)
+
+
+@timed('plot')
+def save_plots(x, ys, xlb, ylbs, figname):
+    """Plot multiple 2D line/point figures, which share a x-axis."""
+    import matplotlib.pyplot as plt
+    print('Generate figure %s' % figname)
+    plt.close('all')
+    n = len(ylbs)
+    if n == 1:  # single plot
+        _, ax = plt.subplots()
+        ax.plot(x, ys[0], 'k-')
+        ax.set_ylabel(ylbs[0])
+    else:       # multiple plots
+        _, axs = plt.subplots(n, sharex=True)
+        for ax, y, ylb in zip(axs, ys, ylbs):
+            ax.plot(x, y, 'k-')
+            ax.set_ylabel(ylb)
+    ax.set_xlabel(xlb)
+    plt.savefig(figname, dpi=300)
 
 
 def run_cmd(args):
     """Command-line mode."""
-    if args.figloc and not HAS_PLOTLIB:
-        raise RuntimeError("Need matplotlib for plotting.")
+    if args.figloc:
+        try:
+            import matplotlib
+        except ImportError:
+            raise RuntimeError("Need matplotlib for plotting.")
 
-    x = {'amber': 'TIME', 'namd': 'TS'}[args.inptype] if not args.x else args.x
+    # the type is checked, or detected, before any file is parsed
+    args.inploc = expand_inputs(args.inploc)
+    inptype, cls = detect(args.inploc, args.inptype)
+    x = args.x if args.x else getattr(cls, 'x_title', None)
     y = args.y if args.y else []
 
+    if args.follow is not None:
+        if args.figloc:
+            raise ValueError("Can't generate figures in the follow mode.")
+        if args.auto_equil:
+            raise ValueError("Can't detect the equilibration in the follow "
+                             "mode.")
+        if args.window or args.max_points:
+            raise ValueError("Can't reduce the data in the follow mode.")
+        if args.dedup:
+            raise ValueError("Can't remove the overlaps in the follow mode.")
+        follow_cmd(args, cls, x, y)
+        return
+
     # parse log file
     # ------------
-    ana = LogAnalyzer(args.inptype)
-    data = ana.analyze(*args.inploc)
+    cache = None if args.nocache else ParseCache()
+    ana = LogAnalyzer(inptype, args.jobs, args.pool, cache)
+    # only parse the data sets and frames asked for
+    columns = [x] + y if x and y else None
+    select = frame_selection(args)
+    if not (args.nostream or args.figloc or args.auto_equil or args.window or
+            args.max_points or args.jobs > 1 or
+            not hasattr(cls, 'iter_data') or
+            not hasattr(output_class(args.outloc), 'write_rows')):
+        if stream_cmd(args, ana, x, y, columns, select, (inptype, cls)):
+            return
+        # the frames selected so far are selected again
+        select = frame_selection(args)
+    data = ana.analyze(*args.inploc, columns=columns, select=select,
+                       index=args.index, dedup=args.dedup,
+                       detected=(inptype, cls))
+    if x is None:
+        x = next(iter(data))
     for i in y:
         if i not in data:
             raise ValueError("Data set '%s' not found." % i)
+    ylbs = y if y else [i for i in data if i != x]
+
+    # remove equilibration phase
+    # ------------
+    notes = drop_notes(select)
+    if args.auto_equil:
+        x0 = data[x][0]
+        start = trim_equilibration(
+                data, [i for i in ylbs if i not in STEP_TITLES])
+        if not len(data[x]):
+            raise RuntimeError("No data left.")
+        note = ('Equilibration: %d frames removed, %s starts from %s '
+                '(was %s)' % (start, x, data[x][0], x0))
+        print(note)
+        notes.append(note)
 
     # generate output file and/or figure
     # ------------
     xdat = data[x]
-    ydat = [data[i] for i in y] if y else [data[i] for i in data if i != x]
+    ydat = [data[i] for i in ylbs]
+    rxdat, rydat, rylbs = reduce_data(xdat, ydat, ylbs, args.window,
+                                      args.max_points, args.downsample)
 
-    if args.outloc.lower().endswith('.csv'):
-        CsvFile(args.outloc, 'w').write(xdat, *ydat)
-    else:
-        DatFile(args.outloc, 'w').write(xdat, *ydat)
+    out = open_output(args.outloc, True)
+    try:
+        if isinstance(out, BinFile):
+            titles = [x] + rylbs
+            out.write(rxdat, *rydat, titles=titles)
+        else:
+            out.write(rxdat, *rydat)
+    except BaseException:
+        abort_output(out)
+        raise
+    commit_output(out, args.outloc)
 
     if args.figloc:
-        save_plots(xdat, ydat, x, y, args.figloc)
+        if not args.max_points:
+            rxdat, rydat = downsample(rxdat, rydat, PLOT_POINTS,
+                                      args.downsample)
+        save_plots(rxdat, rydat, x, rylbs, args.figloc)
 
     # generate stats file
     # ------------
     if not args.nostats:
-        values = calc_stats(y if y else [i for i in data if i != x], ydat)
-        save_stats(values)
+        values = calc_stats(ylbs, ydat)
+        save_stats(values, notes=notes)
+
+
+def output_class(outloc):
+    """Return the class of the output file by extension."""
+    ext = outloc.lower()
+    if ext.endswith('.csv'):
+        return CsvFile
+    if ext.endswith('.pmd'):
+        return BinFile
+    return DatFile
+
+
+def open_output(outloc, tmp=False):
+    """Open the output file for writing by extension. If tmp, a temporary
+    file next to it is written instead, which replaces it when completed
+    by `commit_output`, so a failure never leaves a truncated file."""
+    if not tmp:
+        return output_class(outloc)(outloc, 'w')
+    out = output_class(outloc)('%s.%d.tmp' % (outloc, os.getpid()), 'w')
+    # reported by the name it gets
+    out.filename = os.path.basename(outloc)
+    return out
+
+
+def commit_output(out, outloc):
+    """Close the temporary output file out and rename it to outloc."""
+    out.close()
+    if os.path.exists(outloc):
+        os.remove(outloc)
+    os.rename(out.filepath, outloc)
+
+
+def abort_output(out):
+    """Close and remove the temporary output file out."""
+    out.close()
+    if os.path.exists(out.filepath):
+        os.remove(out.filepath)
+
+
+def stream_cmd(args, ana, x, y, columns=None, select=None, detected=None):
+    """Streaming mode: write the frames to the output file and accumulate
+    the statistical results while the input files are parsed, without
+    keeping the data in memory. Return False, without writing any file,
+    if a data set is not found in every frame once some frames are written,
+    for the files to be analyzed in memory instead."""
+    pieces = ana.iter_analyze(*args.inploc, columns=columns, select=select,
+                              index=args.index, dedup=args.dedup,
+                              detected=detected)
+    out = open_output(args.outloc, True)
+    iwrite(out)
+    stats = None if args.nostats else StatsCollector()
+    try:
+        titles, nframe = stream(pieces, x, y, out, stats)
+        if not nframe:
+            raise RuntimeError("No data found.")
+        if len(titles) <= 1:
+            raise RuntimeError("No data left.")
+        for i in y:
+            if i not in titles:
+                raise ValueError("Data set '%s' not found." % i)
+    except IncompleteFrames as e:
+        abort_output(out)
+        print('%s Analyze the files in memory.' % e)
+        return False
+    except BaseException:
+        abort_output(out)
+        raise
+    finally:
+        # an entry of the cache being written is dropped
+        pieces.close()
+    commit_output(out, args.outloc)
+    count('frames', nframe)
+    if stats is not None:
+        save_stats(stats.calc_stats(titles[1:]), notes=drop_notes(select),
+                   method=BLOCKING)
+    return True
+
+
+def drop_notes(select):
+    """Return the notes of the frames dropped for overlapping other
+    files."""
+    if select is None:
+        return []
+    return ['Overlap: %d frames of %s dropped, from step %d to %d' % (
+            n, name, first, last) for name, n, first, last in select.drops]
+
+
+def follow_cmd(args, cls, x, y):
+    """Follow mode: parse the lines appended to the input files, of the
+    parser class cls, and append the new frames to the output file and
+    update the stats file."""
+    if not hasattr(cls, 'update'):
+        raise ValueError("Can't follow %s files." % cls.filetype)
+    # the frames are selected in the order they are appended
+    select = frame_selection(args)
+    logs = [cls(f, select=select) for f in args.inploc]
+    out = open_output(args.outloc)
+    if not hasattr(out, 'write_rows'):
+        raise ValueError("Can't append data to %s files." % out.filetype)
+    print('Follow %s, press Ctrl-C to stop' % ' '.join(args.inploc))
+
+    frames = FrameBuffer(x, y)
+    stats = StatsCollector()
+    try:
+        while True:
+            new = False
+            for log in logs:
+                cols = frames.feed(log.update())
+                if not cols:
+                    continue
+                new = True
+                out.write_rows(zip(*cols))
+                if not args.nostats:
+                    for t, c in zip(frames.titles[1:], cols[1:]):
+                        stats.add_column(t).extend(c)
+
+            if new:
+                out.fp.flush()
+                if not args.nostats:
+                    save_stats(stats.calc_stats(frames.titles[1:]),
+                               method=BLOCKING)
+            time.sleep(args.follow)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        out.close()
@@ -0,0 +1,196 @@
+"""
+Columnar storage of parsed data.
+"""
+
+from __future__ import absolute_import
+from array import array
+import json
+import struct
+import sys
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    # python 2.x
+    from collections import MutableMapping
+
+__all__ = ['ColumnData']
+
+# step counters are stored as integers, everything else as doubles
+STEP_TITLES = ('TS', 'NSTEP')
+
+try:
+    array('q')
+except ValueError:
+    # python 2.x has no 'q', but 'l' is 64-bit on LP64 platforms
+    STEP_TYPECODE = 'l'
+else:
+    STEP_TYPECODE = 'q'
+FLOAT_TYPECODE = 'd'
+
+CONVERTERS = {STEP_TYPECODE: int, FLOAT_TYPECODE: float}
+
+# binary format written by dump_columns:
+# MAGIC, the length of the header (little-endian uint32), the header in JSON
+# and the columns as little-endian 8-byte numbers one after another
+MAGIC = b'PYMDLOG\x01'
+DTYPES = {STEP_TYPECODE: '<i8', FLOAT_TYPECODE: '<f8'}
+TYPECODES = dict((v, k) for k, v in DTYPES.items())
+
+
+def dump_columns(fp, titles, columns):
+    """Write columns (typed arrays or sequences of floats) with their titles
+    to a file opened in binary mode, which can be read by ColumnData.load."""
+    columns = [c if getattr(c, 'typecode', None) in DTYPES
+               else array(FLOAT_TYPECODE, c) for c in columns]
+    header = json.dumps({'columns': [
+             [t, DTYPES[c.typecode], len(c)]
+             for t, c in zip(titles, columns)]}).encode('utf-8')
+    fp.write(MAGIC + struct.pack('<I', len(header)) + header)
+    for c in columns:
+        if sys.byteorder == 'big':
+            c = array(c.typecode, c)
+            c.byteswap()
+        c.tofile(fp)
+
+
+def typecode_of(title):
+    """Return the array typecode used to store the data set title."""
+    return STEP_TYPECODE if title in STEP_TITLES else FLOAT_TYPECODE
+
+
+class ColumnData(MutableMapping):
+    """An ordered mapping of titles to typed arrays.
+
+    Each data set is one `array.array` column, which takes 8 bytes per
+    frame and supports the buffer protocol, so it can be wrapped with
+    `numpy.frombuffer` without copying. Values are converted when they are
+    appended, either from numbers or from the text found in the log files.
+    """
+
+    def __init__(self, titles=()):
+        self._titles = []
+        self._columns = {}
+        self._row = None
+        for t in titles:
+            self.add_column(t)
+
+    def add_column(self, title):
+        """Return the column of title, which is created if not existing."""
+        col = self._columns.get(title)
+        if col is None:
+            col = self._columns[title] = self.new_column(title)
+            self._titles.append(title)
+            self._row = None
+        return col
+
+    def new_column(self, title):
+        """Create an empty column for title."""
+        return array(typecode_of(title))
+
+    def append(self, title, value):
+        """Append a single value to the column of title."""
+        col = self.add_column(title)
+        col.append(CONVERTERS[col.typecode](value))
+
+    def append_row(self, values):
+        """Append a frame whose values are in the order of the titles."""
+        row = self._row
+        if row is None:
+            # cache the bound appenders, this is called for every frame
+            cols = [self._columns[t] for t in self._titles]
+            row = self._row = [(c.append, CONVERTERS[c.typecode])
+                               for c in cols]
+        for (append, conv), v in zip(row, values):
+            append(conv(v))
+
+    def extend_flat(self, values, offset=0, positions=None, stride=None):
+        """Append frames given as a flat sequence of values, where each frame
+        is offset values to be skipped followed by one value per title.
+
+        Otherwise, positions are where the values of the titles are in a
+        frame of stride values, and the other values are skipped.
+        """
+        if positions is None:
+            positions = range(offset, offset+len(self._titles))
+        if stride is None:
+            stride = offset + len(self._titles)
+        for p, t in zip(positions, self._titles):
+            col = self._columns[t]
+            col.extend(map(CONVERTERS[col.typecode], values[p::stride]))
+
+    def extend(self, other):
+        """Append all columns of another mapping to the matching columns."""
+        for t, v in other.items():
+            col = self.add_column(t)
+            if getattr(v, 'typecode', None) == col.typecode:
+                col.extend(v)
+            else:
+                col.extend(CONVERTERS[col.typecode](i) for i in v)
+
+    def dump(self, fp):
+        """Write the columns to a file opened in binary mode."""
+        dump_columns(fp, self._titles, [self._columns[t] for t in self._titles])
+
+    @classmethod
+    def load(cls, fp, columns=None):
+        """Read the columns written by dump from a file opened in binary
+        mode. If columns is given, only the columns of these titles are
+        read, and the others are skipped."""
+        if fp.read(len(MAGIC)) != MAGIC:
+            raise RuntimeError('Invalid %s binary data.' % cls.__name__)
+        size, = struct.unpack('<I', fp.read(4))
+        header = json.loads(fp.read(size).decode('utf-8'))
+        data = cls()
+        for title, dtype, n in header['columns']:
+            col = array(TYPECODES[dtype])
+            if columns is not None and title not in columns:
+                fp.seek(n*col.itemsize, 1)
+                continue
+            col.fromfile(fp, n)
+            if sys.byteorder == 'big':
+                col.byteswap()
+            data._columns[title] = col
+            data._titles.append(title)
+        return data
+
+    @classmethod
+    def iter_load(cls, fp, columns=None):
+        """Yield the blocks of columns written by successive dump calls
+        until the end of the file."""
+        while fp.read(1):
+            fp.seek(-1, 1)
+            yield cls.load(fp, columns)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_row'] = None
+        return state
+
+    def __getitem__(self, title):
+        return self._columns[title]
+
+    def __setitem__(self, title, values):
+        if title not in self._columns:
+            self._titles.append(title)
+        self._row = None
+        col = self._columns[title] = self.new_column(title)
+        if getattr(values, 'typecode', None) == col.typecode:
+            col.extend(values)
+        else:
+            col.extend(CONVERTERS[col.typecode](i) for i in values)
+
+    def __delitem__(self, title):
+        del self._columns[title]
+        self._titles.remove(title)
+        self._row = None
+
+    def __iter__(self):
+        return iter(self._titles)
+
+    def __len__(self):
+        return len(self._titles)
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, ', '.join(
+                           '%s[%d]' % (t, len(self._columns[t]))
+                           for t in self._titles))
@@ -0,0 +1,211 @@
+"""
+Reading gzip, bzip2 and xz compressed files.
+"""
+
+from __future__ import absolute_import
+import io
+import sys
+
+__all__ = ['SUFFIXES', 'compressed_tell', 'compression', 'kind_of',
+           'open_compressed', 'open_stream']
+
+# magic bytes of the compressed files
+MAGICS = ((b'\x1f\x8b', 'gzip'), (b'BZh', 'bz2'), (b'\xfd7zXZ\x00', 'xz'))
+
+# usual suffixes of the compressed files, see batch.find_runs
+SUFFIXES = ('.gz', '.bz2', '.xz')
+
+# bytes of a compressed file read at a time
+CHUNK_SIZE = 1 << 18
+
+# size of the read buffer of the decompressed data
+BUFFER_SIZE = 1 << 20
+
+# number of blocks decompressed ahead of the reader
+AHEAD = 8
+
+
+def compression(filename):
+    """Return the compression of the file ('gzip', 'bz2' or 'xz') by its
+    magic bytes, or None if it's not compressed."""
+    with open(filename, 'rb') as f:
+        return kind_of(f.read(6))
+
+
+def kind_of(head):
+    """Return the compression of the data beginning with head, or None."""
+    for magic, kind in MAGICS:
+        if head.startswith(magic):
+            return kind
+    return None
+
+
+def decompressor(kind):
+    """Return a new decompressor object of a stream of kind."""
+    # the modules are imported here as only some files are compressed
+    if kind == 'gzip':
+        import zlib
+        # 16 for the gzip header and trailer
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if kind == 'bz2':
+        import bz2
+        return bz2.BZ2Decompressor()
+    if kind == 'xz':
+        try:
+            import lzma
+        except ImportError:
+            raise RuntimeError("Need lzma to read xz files.")
+        return lzma.LZMADecompressor()
+    raise ValueError("Unsupported compression %s" % kind)
+
+
+def decompress(fp, kind, size=CHUNK_SIZE):
+    """Yield the decompressed blocks of the compressed file object fp,
+    which is read size bytes at a time. Concatenated streams (like those
+    written by pigz or pbzip2) are decompressed one after another."""
+    d = decompressor(kind)
+    for data in iter(lambda: fp.read(size), b''):
+        while data:
+            if _eof(d):
+                # gzip files may be padded with zeros
+                if not data.strip(b'\0'):
+                    break
+                d = decompressor(kind)
+            block = d.decompress(data)
+            if block:
+                yield block
+            data = d.unused_data if _eof(d) else b''
+    if not _eof(d):
+        raise EOFError("Compressed file ended before the end-of-stream "
+                       "marker was reached")
+
+
+def _eof(d):
+    # the zlib objects of Python 2 have no eof
+    return getattr(d, 'eof', bool(d.unused_data))
+
+
+def open_compressed(filename, kind=None, ahead=AHEAD):
+    """Open a compressed file for reading in binary mode, which is
+    decompressed as it's read. kind is detected by `compression` if not
+    given.
+
+    Unless ahead is 0, the file is decompressed by a thread up to ahead
+    blocks ahead of the reader, so decompressing overlaps with parsing.
+    """
+    if kind is None:
+        kind = compression(filename)
+    # fail before the file is opened
+    decompressor(kind)
+    return open_stream(io.open(filename, 'rb', buffering=0), kind, ahead)
+
+
+def open_stream(fp, kind, ahead=AHEAD):
+    """Return a buffered reader of the data decompressed from the file
+    object fp, which is closed with it, like `open_compressed`. A thread
+    decompressing ahead must not share a lock with the reader, so fp
+    should be unbuffered then."""
+    return io.BufferedReader(_BlockReader(fp, decompress(fp, kind), ahead),
+                             BUFFER_SIZE)
+
+
+def compressed_tell(fp):
+    """Return the bytes of the compressed file read by fp, a reader given
+    by `open_compressed`, which may be called by another thread."""
+    return fp.raw.fp.tell()
+
+
+class _BlockReader(io.RawIOBase):
+    """Read the blocks of bytes given by an iterator, which is gone through
+    by a thread up to ahead blocks ahead of the reader if ahead > 0. The
+    thread is started by the first read. fp is closed with the reader."""
+
+    def __init__(self, fp, blocks, ahead=0):
+        super(_BlockReader, self).__init__()
+        self.fp = fp
+        self.blocks = blocks
+        self.ahead = ahead
+        self.thread = None
+        self.block = memoryview(b'')
+        self.pos = 0
+        # bytes given to the reader
+        self.offset = 0
+
+    def _start(self):
+        import threading
+        try:
+            from queue import Full, Queue
+        except ImportError:
+            from Queue import Full, Queue
+        self.queue = Queue(self.ahead)
+        self.full = Full
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run)
+        # the thread never holds a lock of the reader, so it's safe to
+        # leave it at exit
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self):
+        try:
+            for block in self.blocks:
+                if not self._put(block):
+                    return
+            self._put(b'')
+        except Exception as e:
+            # raised by the reader
+            self._put(e)
+
+    def _put(self, item):
+        # the reader may be closed while the queue is full
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except self.full:
+                pass
+        return False
+
+    def _next(self):
+        if not self.ahead:
+            return next(self.blocks, b'')
+        if self.thread is None:
+            self._start()
+        item = self.queue.get()
+        if isinstance(item, Exception):
+            self.blocks = None
+            raise item
+        return item
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self.pos >= len(self.block):
+            if self.blocks is None:
+                return 0
+            block = self._next()
+            if not block:
+                self.blocks = None
+                return 0
+            self.block, self.pos = memoryview(block), 0
+        n = min(len(b), len(self.block)-self.pos)
+        b[:n] = self.block[self.pos:self.pos+n]
+        self.pos += n
+        self.offset += n
+        return n
+
+    def tell(self):
+        return self.offset
+
+    def close(self):
+        if not self.closed:
+            if self.thread is not None:
+                self.stopped.set()
+                # a daemon thread may be gone already at exit
+                if getattr(sys, 'is_finalizing', lambda: False)():
+                    return
+                self.thread.join()
+            self.blocks = None
+            self.fp.close()
+        super(_BlockReader, self).close()
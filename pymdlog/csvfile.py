@@ -12,6 +12,7 @@ import sys
 IS_PY3 = sys.version_info.major >= 3
 
 from .basefile import TextFile
+from .profiling import timed
 
 __all__ = ['CsvFile']
 
@@ -31,9 +32,13 @@ class CsvFile(TextFile):
 
     def write(self, xdat, *ydat):
         super(CsvFile, self).write()
-        writer = csv.writer(self.fp, dialect='excel')
-        for d in zip(xdat, *ydat):
-            writer.writerow(d)
+        self.write_rows(zip(xdat, *ydat))
+
+    @timed('write')
+    def write_rows(self, rows):
+        """Write rows of x and y values, which can be called repeatedly
+        after write or on its own."""
+        csv.writer(self.fp, dialect='excel').writerows(rows)
 
     def read(self):
         super(CsvFile, self).read()
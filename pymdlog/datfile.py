@@ -9,6 +9,7 @@ except ImportError:
     pass
 
 from .basefile import TextFile
+from .profiling import timed
 
 __all__ = ['DatFile']
 
@@ -30,13 +31,24 @@ class DatFile(TextFile):
             if xlen != ylen:
                 raise ValueError("$%d x=%d y=%d" % (i, xlen, ylen))
 
+        self.write_rows(zip(xdat, *ydat), **fmt)
+
+    @timed('write')
+    def write_rows(self, rows, **fmt):
+        """Write rows of x and y values, which can be called repeatedly
+        after write or on its own.
+        fmt: xfmt, yfmt, sep
+        """
         xfmt = fmt.get('xfmt', 's')
         yfmt = fmt.get('yfmt', 's')
         sep = fmt.get('sep', ' ')
-        fmt = '%' + xfmt + (sep + '%' + yfmt)*len(ydat) + '\n'
 
-        for txt in zip(xdat, *ydat):
-            self.fp.write(fmt % txt)
+        line = None
+        write = self.fp.write
+        for txt in rows:
+            if line is None:
+                line = '%' + xfmt + (sep + '%' + yfmt)*(len(txt)-1) + '\n'
+            write(line % tuple(txt))
 
     def read(self):
         """Read a dat file."""
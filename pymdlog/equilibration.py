@@ -0,0 +1,141 @@
+"""
+Detection of the equilibration phase of data sets.
+"""
+
+from __future__ import absolute_import, division
+try:
+    from future_builtins import zip
+except ImportError:
+    pass
+from array import array
+from math import fsum
+
+from .columns import STEP_TITLES
+from .profiling import timed
+from .stats import WINDOW, fft, get_numpy, inefficiencies, inefficiency
+
+__all__ = ['detect_equilibration', 'trim_equilibration']
+
+# maximum number of candidate start frames
+CANDIDATES = 100
+
+# minimum number of candidate start frames, which limits the lags of the
+# autocorrelation functions of long correlated data sets
+MIN_CANDIDATES = 20
+
+
+def correlate(us, vs, nlag):
+    """Return the sums of u[i]*v[i+t] over i for t in range(nlag+1) of
+    each pair of u in us and v in vs, where all us have the same length,
+    and all vs are the same length, at most nlag values longer.
+
+    numpy is used if available, otherwise the pure Python FFT is used, with
+    u and v transformed at once as a single complex sequence.
+    """
+    # padded so that u[i]*v[i+t] never wraps around to the start of v
+    size = 1
+    while size < max(len(us[0]) + nlag, len(vs[0])):
+        size *= 2
+    np = get_numpy()
+    if np is not None:
+        u = np.fft.rfft(np.array([np.asarray(i) for i in us]), size)
+        v = np.fft.rfft(np.array([np.asarray(i) for i in vs]), size)
+        c = np.fft.irfft(u.conj()*v, size)[:, :nlag+1]
+        return [list(i) for i in c]
+
+    result = []
+    for u, v in zip(us, vs):
+        z = ([complex(a, b) for a, b in zip(u, v)] +
+             [complex(0, b) for b in v[len(u):]])
+        z = fft(z + [0j]*(size-len(z)))
+        # with U and V the transforms of u and v, taken from Z[k] and Z[-k],
+        # the correlation is the inverse transform of conj(U)*V
+        rev = z[:1] + z[:0:-1]
+        w = fft([(a+b.conjugate())*(a.conjugate()-b) for a, b in zip(z, rev)])
+        result.append([-i.imag/(4*size) for i in w[:nlag+1]])
+    return result
+
+
+def detect_equilibration(data):
+    """Return the start frame of the equilibrated part of each data set,
+    which maximizes the number of effectively uncorrelated samples
+    (n-t0)/g(t0) of the data after it (Chodera, 2016). The data sets have
+    to be of the same length.
+
+    Instead of analyzing the data after every candidate start frame from
+    scratch, the data sets are cut into segments at the candidates, and
+    the lagged products of each segment are summed for all lags at once
+    with the FFT. The autocovariance function after a candidate is then
+    obtained by adding up the sums of the following segments.
+    """
+    if not data:
+        return []
+    n = len(data[0])
+    if any(len(d) != n for d in data):
+        raise ValueError("Data sets of different lengths found.")
+    if n < 2*MIN_CANDIDATES:
+        return [0]*len(data)
+
+    # the lags needed by the autocorrelation functions, where the
+    # candidates are at least that far apart to keep the cost near
+    # O(n log n)
+    nlag = int(WINDOW*max(inefficiencies(data))) + 1
+    nlag = min(nlag, n // MIN_CANDIDATES)
+    ncand = min(CANDIDATES, n // nlag)
+    bounds = [n*k//ncand for k in range(ncand+1)]
+
+    xs = []
+    for d in data:
+        m = fsum(d) / len(d)
+        xs.append(array('d', [i-m for i in d]))
+    sums = [correlate([x[a:b] for x in xs], [x[a:b+nlag] for x in xs], nlag)
+            for a, b in zip(bounds, bounds[1:])]
+    return [_best_start(x, bounds, [s[i] for s in sums], nlag)
+            for i, x in enumerate(xs)]
+
+
+def _best_start(x, bounds, sums, nlag):
+    """Return the candidate start frame of x with the most effective
+    samples, where sums are the lagged products of the segments."""
+    n = len(x)
+    # sums of the data after each candidate, and of the last t values
+    after = [fsum(x[a:b]) for a, b in zip(bounds, bounds[1:])]
+    for k in range(len(after)-2, -1, -1):
+        after[k] += after[k+1]
+    tail = [0.0]
+    for t in range(1, nlag+1):
+        tail.append(tail[-1] + x[n-t])
+
+    best, start = None, 0
+    lagged = [0.0]*(nlag+1)
+    for k in range(len(after)-1, -1, -1):
+        t0 = bounds[k]
+        lagged = [a+b for a, b in zip(lagged, sums[k])]
+        size = n - t0
+        s = after[k]
+        m = s / size
+        acov, head = [], 0.0
+        for t in range(min(nlag, size-1)+1):
+            # the sums of x[t0:n-t] and x[t0+t:n] around the mean m
+            acov.append(lagged[t] - m*(2*s-tail[t]-head) + (size-t)*m*m)
+            head += x[t0+t]
+        neff = size / inefficiency(acov)
+        if best is None or neff >= best:
+            best, start = neff, t0
+    return start
+
+
+@timed('equilibration')
+def trim_equilibration(data, titles=None):
+    """Remove the equilibration phase from all the data sets of data, a
+    `ColumnData`, in place. The start of the equilibrated part is the
+    latest one detected in the data sets of titles (default: all but the
+    steps). Return the number of removed frames."""
+    if titles is None:
+        titles = [t for t in data if t not in STEP_TITLES]
+    starts = detect_equilibration([data[t] for t in titles])
+    start = max(starts) if starts else 0
+    if start:
+        for t in data:
+            del data[t][:start]
+    return start
@@ -3,7 +3,9 @@ GUI module.
 """
 
 from __future__ import absolute_import, division
+from bisect import bisect_right
 import os
+import threading
 try:
     # python 2.x
     from Tkinter import *
@@ -20,38 +22,219 @@ except ImportError:
     from tkinter.simpledialog import Dialog
 
 try:
-    import matplotlib.pyplot as plt
+    # only the backend is imported when plotting, see PlotWindow
+    import matplotlib
 except ImportError:
     HAS_PLOTLIB = False
 else:
     HAS_PLOTLIB = True
 
-    def show_plots(x, ys, xlb, ylbs):
-        """Plot multiple 2D line/point figures, which share a x-axis."""
-        plt.close('all')
-        n = len(ylbs)
-        if n == 1:  # single plot
-            _, ax = plt.subplots()
-            ax.plot(x, ys[0], 'k-')
-            ax.set_ylabel(ylbs[0])
-        else:       # multiple plots
-            _, axs = plt.subplots(n, sharex=True)
-            for ax, y, ylb in zip(axs, ys, ylbs):
-                ax.plot(x, y, 'k-')
-                ax.set_ylabel(ylb)
-        ax.set_xlabel(xlb)
-        plt.show()
-
 from . import __doc__ as DOC, __program__ as NAME, __version__ as VER
 from .analysis import LogAnalyzer
+from .archive import expand_inputs
+from .binfile import BinFile
 from .datfile import DatFile
 from .csvfile import CsvFile
+from .progress import Cancelled, Progress
+from .reduction import PLOT_POINTS, MinMaxPyramid, downsample
 from .stats import ITEMS, calc_stats, save_stats
 
-INPTYPES = {'Amber': ('Amber MDOUT File', '.mdout .out'),
-            'NAMD': ('NAMD Log File', '.log')}
+INPTYPES = {'Auto': ('MD Log File', '.mdout .out .log .pmd .gz .bz2 .xz'),
+            'Amber': ('Amber MDOUT File', '.mdout .out'),
+            'NAMD': ('NAMD Log File', '.log'),
+            'Binary': ('PyMDLog Binary Data File', '.pmd')}
 OUTTYPES = {'Simple': ('Simple Data File', '.dat'),
-            'CSV': ('Comma-Separated Values File', '.csv')}
+            'CSV': ('Comma-Separated Values File', '.csv'),
+            'Binary': ('PyMDLog Binary Data File', '.pmd')}
+
+# milliseconds between two polls of the loading files
+POLL_INTERVAL = 100
+
+# points plotted per pixel of the width of a plot, see PlotWindow
+PIXEL_POINTS = 2
+
+
+class Loader(object):
+    """Load the data of files in a thread, which is polled by the GUI, so
+    it keeps responding, and may be cancelled."""
+
+    def __init__(self, inptype, files):
+        self.inptype = inptype
+        self.files = files
+        self.progress = Progress()
+        self.data = self.error = None
+        self.done = False
+        self.thread = threading.Thread(target=self.run)
+        # don't keep the program from quitting
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        try:
+            with self.progress:
+                # listing a compressed archive takes a while too
+                files = expand_inputs(self.files)
+                self.progress.set_files(files)
+                self.data = LogAnalyzer(self.inptype).analyze(*files)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+
+    @property
+    def cancelled(self):
+        # the parser may be stopped by an error of the closed file
+        return self.progress.cancelled or isinstance(self.error, Cancelled)
+
+    def cancel(self):
+        self.progress.cancel()
+
+
+class PlotWindow(object):
+    """A window of the plots of y data sets sharing an x-axis, drawn by
+    matplotlib in Tk, which can be zoomed and panned by its toolbar.
+
+    A data set with a `MinMaxPyramid` is plotted with the minima and maxima
+    of the frames in the x range shown, about PIXEL_POINTS points per pixel,
+    which are chosen again whenever the range changes, so the plots keep
+    the details of the frames shown and keep fast however long the data
+    sets are. Others are plotted downsampled once.
+
+    The values at the mouse are shown by a cursor, which is drawn over the
+    figure cached when it was drawn last (blitting), so moving the mouse
+    doesn't draw the plots again.
+    """
+
+    def __init__(self, parent, x, ys, xlb, ylbs, pyramids):
+        # imported here as matplotlib is slow to import
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        try:
+            from matplotlib.backends.backend_tkagg import \
+                NavigationToolbar2Tk
+        except ImportError:
+            # matplotlib < 2.2
+            from matplotlib.backends.backend_tkagg import \
+                NavigationToolbar2TkAgg as NavigationToolbar2Tk
+
+        self.top = Toplevel(parent)
+        self.top.title('%s - Plot' % NAME)
+        self.x = x
+        self.ys = ys
+        self.xlb = xlb
+        self.ylbs = ylbs
+        self.pyramids = pyramids
+        # the x range and number of points of the plotted frames
+        self.shown = None
+        self.background = None
+
+        self.fig = fig = Figure(figsize=(8, 2+2*min(len(ys), 3)))
+        self.axes = []
+        self.lines = []
+        if not all(pyramids):
+            # matplotlib is slow with millions of points, which can't be
+            # seen anyway
+            fixed = downsample(x, [y for y, p in zip(ys, pyramids)
+                                   if p is None], PLOT_POINTS)
+            fixed = iter(zip([fixed[0]]*len(fixed[1]), fixed[1]))
+        for i, (ylb, pyr) in enumerate(zip(ylbs, pyramids)):
+            ax = fig.add_subplot(len(ys), 1, i+1,
+                                 sharex=self.axes[0] if self.axes else None)
+            if pyr is None:
+                xy = next(fixed)
+            else:
+                xy = pyr.view(x[0], x[-1], self.npoint(ax))
+            self.lines.extend(ax.plot(xy[0], xy[1], 'k-'))
+            ax.set_ylabel(ylb)
+            self.axes.append(ax)
+        ax.set_xlabel(xlb)
+        self.cursors = [ax.axvline(x[0], color='r', lw=0.8, animated=True,
+                                   visible=False) for ax in self.axes]
+        self.readout = fig.text(0.01, 0.99, '', va='top', animated=True)
+
+        self.canvas = canvas = FigureCanvasTkAgg(fig, master=self.top)
+        canvas.draw()
+        self.toolbar = NavigationToolbar2Tk(canvas, self.top)
+        self.toolbar.update()
+        canvas.get_tk_widget().pack(side='top', fill='both', expand=1)
+        # the axes share the x range, so any of them tells its change
+        for ax in self.axes:
+            ax.callbacks.connect('xlim_changed', self.on_xlim_changed)
+        canvas.mpl_connect('resize_event', self.on_resize)
+        canvas.mpl_connect('draw_event', self.on_draw)
+        canvas.mpl_connect('motion_notify_event', self.on_motion)
+        canvas.mpl_connect('figure_leave_event', self.on_leave)
+
+    def npoint(self, ax):
+        """Return the number of points of a plot as wide as ax."""
+        return max(PLOT_POINTS // 10, int(ax.bbox.width * PIXEL_POINTS))
+
+    def update_lines(self):
+        """Plot the frames of the x range shown by the pyramids."""
+        x0, x1 = self.axes[0].get_xlim()
+        npoint = self.npoint(self.axes[0])
+        if self.shown == (x0, x1, npoint):
+            return
+        self.shown = x0, x1, npoint
+        for line, pyr in zip(self.lines, self.pyramids):
+            if pyr is not None:
+                line.set_data(*pyr.view(min(x0, x1), max(x0, x1), npoint))
+
+    def on_xlim_changed(self, ax):
+        # the plots are drawn after the change by the toolbar
+        self.update_lines()
+
+    def on_resize(self, event):
+        self.update_lines()
+
+    def on_draw(self, event):
+        # cache the figure without the cursor
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self.draw_cursor()
+
+    def draw_cursor(self):
+        """Draw the cursor over the cached figure."""
+        if self.background is None:
+            return
+        self.canvas.restore_region(self.background)
+        for ax, cursor in zip(self.axes, self.cursors):
+            ax.draw_artist(cursor)
+        self.fig.draw_artist(self.readout)
+        self.canvas.blit(self.fig.bbox)
+
+    def on_motion(self, event):
+        # leave the figure alone while it's dragged
+        if event.button is not None:
+            return
+        if event.inaxes not in self.axes:
+            self.on_leave(event)
+            return
+        x = event.xdata
+        for cursor in self.cursors:
+            cursor.set_xdata([x, x])
+            cursor.set_visible(True)
+        text = '%s = %g' % (self.xlb, x)
+        # the frame at the cursor can only be found if x is in order
+        if self.pyramids[0] is not None:
+            i = max(0, bisect_right(self.x, x) - 1)
+            text += ''.join('    %s = %g' % (t, y[i])
+                            for t, y in zip(self.ylbs, self.ys))
+        self.readout.set_text(text)
+        self.readout.set_visible(True)
+        self.draw_cursor()
+
+    def on_leave(self, event):
+        if not self.readout.get_visible():
+            return
+        for cursor in self.cursors:
+            cursor.set_visible(False)
+        self.readout.set_visible(False)
+        self.draw_cursor()
+
+    def close(self):
+        # it may be closed by the window manager already
+        if self.top.winfo_exists():
+            self.top.destroy()
 
 
 class PyMDLogGUI(object):
@@ -59,6 +242,13 @@ class PyMDLogGUI(object):
 
     def __init__(self, parent=None):
         self.parent = parent
+        self.data = None
+        # the loading files, and the statistical results by data set and
+        # the pyramids by (x, y) data sets of the data loaded
+        self.loader = None
+        self.stats = {}
+        self.pyramids = {}
+        self.plotwin = None
         self.create_widgets()
 
     def create_widgets(self):
@@ -90,7 +280,7 @@ class PyMDLogGUI(object):
         types = sorted(INPTYPES.keys())
         OptionMenu(ioframe,
                    self.inptype,
-                   'Amber',
+                   'Auto',
                    *types).grid(row=0, column=1, sticky='w')
 
         Label(ioframe, text='Output type:').grid(row=0, column=2, sticky='w')
@@ -117,8 +307,9 @@ class PyMDLogGUI(object):
         Button(ioframe, command=self.on_browse_clicked,
                text='Browse').grid(row=1, column=2)
 
-        Button(ioframe, command=self.on_load_clicked,
-               text='Load').grid(row=1, column=3)
+        self.loadbut = Button(ioframe, command=self.on_load_clicked,
+                              text='Load')
+        self.loadbut.grid(row=1, column=3)
 
         Label(ioframe, text='Output file:').grid(row=2, column=0, sticky='w')
 
@@ -182,6 +373,24 @@ class PyMDLogGUI(object):
         self.ybox = Listbox(yframe, state='disabled', height=16)
         self.ybox.pack(fill='both', expand=1)
 
+        # progress of loading
+        # ==========
+        progframe = Frame(page)
+        progframe.pack(fill='x', expand=0, pady=4)
+
+        self.status = StringVar()
+
+        Label(progframe, textvariable=self.status,
+              width=40).pack(side='left')
+
+        self.cancelbut = Button(progframe, text='Cancel', state='disabled',
+                                command=self.on_cancel_clicked)
+        self.cancelbut.pack(side='right')
+
+        self.progbar = Progressbar(progframe, orient='horizontal',
+                                   mode='determinate', maximum=100)
+        self.progbar.pack(side='right', fill='x', expand=1, padx=4)
+
         Separator(self.parent, orient='horizontal').pack(fill='x', expand=0)
 
         butframe = Frame(self.parent)
@@ -191,7 +400,7 @@ class PyMDLogGUI(object):
                         command=self.on_output_clicked, default='active')
         plotbut = Button(butframe, text='Plot', command=self.on_plot_clicked,
                          state='normal' if HAS_PLOTLIB else 'disabled')
-        quitbut = Button(butframe, text='Quit', command=self.parent.destroy)
+        quitbut = Button(butframe, text='Quit', command=self.on_quit_clicked)
         quitbut.pack(side='right', pady=4)
         plotbut.pack(side='right', pady=4)
         outbut.pack(side='right', pady=4)
@@ -222,27 +431,74 @@ class PyMDLogGUI(object):
             else:
                 self.inplocs = self.parent.tk.splitlist(inplocs)
 
-            ana = LogAnalyzer(self.inptype.get())
-            try:
-                self.data = ana.analyze(*self.inplocs)
-            except Exception:
-                showerror('ERROR!',
-                          'Failed to parse the input files.',
-                          parent=self.parent)
-                return
+            # the files are parsed in the background, see poll_load
+            self.loader = Loader(self.inptype.get(), self.inplocs)
+            self.loadbut['state'] = 'disabled'
+            self.cancelbut['state'] = 'normal'
+            self.progbar['value'] = 0
+            self.status.set('Loading...')
+            self.parent.after(POLL_INTERVAL, self.poll_load)
+
+    def poll_load(self):
+        loader = self.loader
+        if loader is None:
+            return
+        if not loader.done:
+            progress = loader.progress
+            current = progress.current()
+            if current is not None and not loader.cancelled:
+                self.status.set('Loading %d/%d: %s' % (
+                                current[0]+1, len(progress.files),
+                                current[1]))
+            self.progbar['value'] = progress.fraction() * 100
+            self.parent.after(POLL_INTERVAL, self.poll_load)
+            return
 
-            # clear/activate listboxes
-            if self.itembox['state'] == 'normal':
-                for w in self.itembox, self.xbox, self.ybox:
-                    w.delete(0, 'end')
-            else:
-                for w in self.itembox, self.xbox, self.ybox:
-                    w['state'] = 'normal'
+        self.loader = None
+        self.loadbut['state'] = 'normal'
+        self.cancelbut['state'] = 'disabled'
+        if loader.cancelled:
+            self.progbar['value'] = 0
+            self.status.set('Loading cancelled.')
+            return
+        if loader.error is not None:
+            self.progbar['value'] = 0
+            self.status.set('Failed to load.')
+            showerror('ERROR!',
+                      'Failed to parse the input files.\n%s' % loader.error,
+                      parent=self.parent)
+            return
+        self.progbar['value'] = 100
+        self.data = loader.data
+        # the statistical results of the data before are no longer valid
+        self.stats = {}
+        self.pyramids = {}
+        self.status.set('Loaded %d data sets of %d frames.' % (
+                        len(self.data),
+                        max(len(v) for v in self.data.values())))
+
+        # clear/activate listboxes
+        if self.itembox['state'] == 'normal':
+            for w in self.itembox, self.xbox, self.ybox:
+                w.delete(0, 'end')
+        else:
+            for w in self.itembox, self.xbox, self.ybox:
+                w['state'] = 'normal'
 
-            # put found items into the item box
-            for k in self.data:
-                self.itembox.insert('end', k)
-            self.itembox.selection_set(0)
+        # put found items into the item box
+        for k in self.data:
+            self.itembox.insert('end', k)
+        self.itembox.selection_set(0)
+
+    def on_cancel_clicked(self):
+        if self.loader is not None:
+            self.loader.cancel()
+            self.status.set('Cancelling...')
+
+    def on_quit_clicked(self):
+        if self.loader is not None:
+            self.loader.cancel()
+        self.parent.destroy()
 
     def on_saveas_clicked(self):
         ext = OUTTYPES[self.outtype.get()]
@@ -256,9 +512,13 @@ class PyMDLogGUI(object):
             showerror('ERROR!', 'Please specify Y-axis.', parent=self.parent)
         else:
             ylbs = self.ybox.get(0, 'end')
-            ys = [self.data[i] for i in ylbs]
             try:
-                values = calc_stats(ylbs, ys)
+                # only the data sets not done since loading are computed
+                new = [i for i in ylbs if i not in self.stats]
+                if new:
+                    values = calc_stats(new, [self.data[i] for i in new])
+                    self.stats.update(zip(new, values))
+                values = [self.stats[i] for i in ylbs]
                 StatsTableDialog(values, parent=self.parent,
                                  title='Statistical Results')
             except Exception:
@@ -348,8 +608,11 @@ class PyMDLogGUI(object):
             x = self.data[xlb]
             ys = [self.data[i] for i in ylbs]
             try:
-                if self.outtype.get() == 'Simple':
+                outtype = self.outtype.get()
+                if outtype == 'Simple':
                     DatFile(outloc, 'w').write(x, *ys)
+                elif outtype == 'Binary':
+                    BinFile(outloc, 'w').write(x, *ys, titles=(xlb,)+ylbs)
                 else:
                     CsvFile(outloc, 'w').write(x, *ys)
             except Exception:
@@ -374,12 +637,31 @@ class PyMDLogGUI(object):
             x = self.data[xlb]
             ys = [self.data[i] for i in ylbs]
             try:
-                show_plots(x, ys, xlb, ylbs)
+                pyramids = [self.pyramid(xlb, i) for i in ylbs]
+                if self.plotwin is not None:
+                    self.plotwin.close()
+                self.plotwin = PlotWindow(self.parent, x, ys, xlb, ylbs,
+                                          pyramids)
             except Exception:
                 showerror('ERROR!',
                           'Failed to plot.',
                           parent=self.parent)
 
+    def pyramid(self, xlb, ylb):
+        """Return the MinMaxPyramid of the x and y data sets, or None if x
+        is not in order, which is made once for the data loaded."""
+        key = xlb, ylb
+        if key not in self.pyramids:
+            self.status.set('Preparing the plot of %s...' % ylb)
+            self.parent.update_idletasks()
+            try:
+                pyr = MinMaxPyramid(self.data[xlb], self.data[ylb])
+            except ValueError:
+                pyr = None
+            self.pyramids[key] = pyr
+            self.status.set('')
+        return self.pyramids[key]
+
 
 class SortFileDialog(Dialog):
     """Show selected files and sort."""
@@ -491,11 +773,13 @@ class StatsTableDialog(Dialog):
 
         self.tree.column(ITEMS[0], width=100, anchor='w')
         self.tree.heading(ITEMS[0], text=ITEMS[0])
-        for c in ITEMS[1:-1]:
-            self.tree.column(c, width=100, anchor='w')
+        for c in ITEMS[1:]:
+            # the confidence intervals are wider
+            if c.startswith('CI95%'):
+                self.tree.column(c, width=200, anchor='center')
+            else:
+                self.tree.column(c, width=100, anchor='w')
             self.tree.heading(c, text=c)
-        self.tree.column(ITEMS[-1], width=200, anchor='center')
-        self.tree.heading(ITEMS[-1], text=ITEMS[-1])
 
         for i, v in enumerate(self.values):
             self.tree.insert('', 'end', values=v)
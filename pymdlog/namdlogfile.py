@@ -3,52 +3,264 @@ Module to parse NAMD log files.
 """
 
 from __future__ import absolute_import
-try:
-    from future_builtins import zip
-except ImportError:
-    pass
+import mmap
+import os
+import re
 
 from .basefile import ReadOnlyTextFile
+from .columns import ColumnData
+from .profiling import count, enabled, stage
 
-__all__ = ['NamdLogFile']
+__all__ = ['NamdLogFile', 'read_chunk']
+
+# approximate size of the byte ranges given by NamdLogFile.split
+CHUNK_SIZE = 1 << 25
+
+# number of lines converted at a time by parse_energy
+BATCH = 8192
+
+# "Info: NAMD 2.9 for Linux-x86_64-multicore"
+PAT_SNIFF = re.compile(br'^(?:Info: NAMD |ETITLE:|ENERGY:)', re.M)
+
+
+def _map(fp):
+    """Memory-map a whole file for reading."""
+    return mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
 
 
 class NamdLogFile(ReadOnlyTextFile):
-    """Parse a NAMD log file."""
+    """Parse a NAMD log file.
+
+    If columns is given, only the energy items of these titles are
+    converted and stored. If select (a `FrameSelection`) is given, only the
+    frames selected are converted, and if index is True too, a step index
+    (see `StepIndex`) is used to seek to them.
+    """
     filetype = "NAMD log"
+    modes = {'r': 'rb'}
+    # default x data set, the data set of the steps, and the pattern of the
+    # files of a run, see registry
+    x_title = step_title = 'TS'
+    pattern = '*.log'
+    # the step is followed by a space, so a partially written one is not
+    # taken
+    pat_step = re.compile(br'^ENERGY:\s+(\d+)\s', re.M)
+    titles = None
+    # positions of the titles in the ENERGY lines, and the number of tokens
+    # of a line, see parse_energy
+    fields = (None, None)
+    # number of lines already parsed, which are the lines up to and
+    # including the ETITLE line when reading the energy items
+    lineno = 0
+
+    def __init__(self, filename, mode='r', columns=None, select=None,
+                 index=False):
+        super(NamdLogFile, self).__init__(filename, mode)
+        self.columns = columns
+        self.select = select
+        self.use_index = index
+
+    @classmethod
+    def sniff(cls, head):
+        """Return whether head, the first bytes of a file, are of a NAMD
+        log, by the banner or the energy lines."""
+        return PAT_SNIFF.search(head) is not None
 
-    def read(self):
+    def read(self, container=ColumnData):
+        """Read the energy items into container, which is called with the
+        titles and filled frame by frame (default: `ColumnData`)."""
         super(NamdLogFile, self).read()
         self.titles = self.read_etitle()
         #self.fp.seek(0)
-        self.values = self.read_energy()
-        self.data = dict(zip(self.titles, zip(*self.values)))
+        self.seek_selected()
+        self.data = self.read_energy(container)
         return self.data
 
     def read_etitle(self):
-        for line in self.fp:
-            if line.startswith('ETITLE:'):
-                titles = line.split()[1:]
+        for i, line in enumerate(self.fp, 1):
+            if line.startswith(b'ETITLE:'):
+                self.set_titles(line)
+                self.lineno = i
                 break
         else:
             raise RuntimeError('No energy items found.')
-        return titles
-
-    def read_energy(self):
-
-        def to_number(x):
-            try:
-                n = int(x)
-            except ValueError:
-                n = float(x)
-            return n
-
-        n = len(self.titles)
-        data = []
-        for i, line in enumerate(self.fp):
-            if line.startswith('ENERGY:'):
-                val = [to_number(x) for x in line.split()[1:]]
-                if len(val) != n:
-                    raise RuntimeError('File broken at line %d' % (i+1))
-                data.append(val)
+        return self.titles
+
+    def set_titles(self, line):
+        """Select the titles of the ETITLE line, and find their values in
+        the ENERGY lines."""
+        titles = line.decode('ascii').split()[1:]
+        positions = [i for i, t in enumerate(titles, 1)
+                     if self.columns is None or t in self.columns]
+        self.titles = [titles[i-1] for i in positions]
+        self.fields = (positions, len(titles)+1)
+
+    def read_energy(self, container=ColumnData):
+        data = container(self.titles)
+        for _ in self.parse_batches(lambda: data):
+            pass
+        return data
+
+    def iter_data(self, container=ColumnData):
+        """Read the energy items batch by batch, and yield a new container
+        with the frames of each batch of lines, so that the whole data is
+        never kept in memory."""
+        super(NamdLogFile, self).read()
+        self.titles = self.read_etitle()
+        self.seek_selected()
+        for data in self.parse_batches(lambda: container(self.titles)):
+            yield data
+
+    def parse_batches(self, new):
+        """Parse the rest of the file a batch of lines at a time into the
+        container returned by new(), which is yielded after each batch."""
+        lineno = self.lineno
+        while True:
+            with stage('read'):
+                lines = self.fp.readlines(CHUNK_SIZE >> 3)
+            if not lines:
+                break
+            if enabled():
+                count('bytes read', sum(map(len, lines)))
+            data = new()
+            with stage('parse'):
+                broken = parse_energy(data, lines, self.fields[0],
+                                      self.fields[1], self.select)
+            if broken:
+                raise RuntimeError('File broken at line %d' % (lineno+broken))
+            lineno += len(lines)
+            yield data
+            if self.reached_limit():
+                break
+
+    def update(self, container=ColumnData):
+        """Parse the lines appended to the file since the last call, which
+        is used to follow the log of a running simulation. Return a new
+        container with the frames found in these lines."""
+        data = None
+        for lines in self.read_appended():
+            if self.titles is None:
+                for i, line in enumerate(lines):
+                    if line.startswith(b'ETITLE:'):
+                        self.set_titles(line)
+                        break
+                else:
+                    self.lineno += len(lines)
+                    continue
+                self.lineno += i+1
+                lines = lines[i+1:]
+            if data is None:
+                data = container(self.titles)
+            broken = parse_energy(data, lines, self.fields[0],
+                                  self.fields[1], self.select)
+            if broken:
+                raise RuntimeError('File broken at line %d' %
+                                   (self.lineno+broken))
+            self.lineno += len(lines)
+
+        if data is None:
+            data = container(self.titles or ())
         return data
+
+    def split(self, size=CHUNK_SIZE):
+        """Find the energy items and split the rest of the file into byte
+        ranges of about size bytes, which end at newlines. Return a list of
+        (start, end) to be read with `read_chunk`."""
+        super(NamdLogFile, self).read()
+        if not os.fstat(self.fp.fileno()).st_size:
+            # an empty file can't be mapped
+            raise RuntimeError('No energy items found.')
+
+        mm = _map(self.fp)
+        try:
+            # the ETITLE line has to start at the beginning of a line
+            pos = mm.find(b'ETITLE:')
+            while pos > 0 and mm[pos-1:pos] != b'\n':
+                pos = mm.find(b'ETITLE:', pos+1)
+            if pos < 0:
+                raise RuntimeError('No energy items found.')
+
+            eol = mm.find(b'\n', pos)
+            start = len(mm) if eol < 0 else eol+1
+            self.set_titles(mm[pos:start])
+            self.lineno = mm[:start].count(b'\n') + (eol < 0)
+
+            ranges = []
+            while start < len(mm):
+                end = mm.find(b'\n', start+size)
+                end = len(mm) if end < 0 else end+1
+                ranges.append((start, end))
+                start = end
+        finally:
+            mm.close()
+        return ranges
+
+
+def read_chunk(filename, start, end, titles, container=ColumnData,
+               fields=(None, None)):
+    """Read the ENERGY lines in the byte range [start, end) of a NAMD log
+    file, where fields are the positions of the titles and the length of
+    the lines (see `parse_energy`). Return the data, the number of lines in
+    the range and the line number of the first broken line counting from
+    the start of the range (0 if none)."""
+    with stage('read'):
+        with open(filename, 'rb') as f:
+            mm = _map(f)
+        try:
+            lines = mm[start:end].split(b'\n')
+        finally:
+            mm.close()
+    count('bytes read', end-start)
+    nlines = len(lines) - 1 if not lines[-1] else len(lines)
+
+    data = container(titles)
+    with stage('parse'):
+        broken = parse_energy(data, lines, *fields)
+    return data, nlines, broken
+
+
+def parse_energy(data, lines, positions=None, stride=None, select=None):
+    """Convert the ENERGY lines found in lines into data, a container of
+    the energy titles. Return the number of the first broken line counting
+    from 1 (0 if none).
+
+    If only some of the titles are in data, positions are where their
+    values are in the tokens of a line, and stride is the number of tokens
+    of a line (default: all titles in order). The other values are never
+    converted, and neither are the frames not kept by select (a
+    `FrameSelection`) if given.
+
+    The column types are fixed by the titles (TS is an integer, the others
+    are floats), so instead of converting line by line, a batch of lines is
+    split into one flat list of tokens and every column is converted in one
+    go by slicing it out of the list.
+    """
+    if stride is None:
+        stride = len(data) + 1
+    for first in range(0, len(lines), BATCH):
+        batch = lines[first:first+BATCH]
+        energy = [line for line in batch if line.startswith(b'ENERGY:')]
+        if enabled():
+            count('lines scanned', len(batch))
+            count('lines matched', len(energy))
+        if not energy:
+            continue
+        tokens = b' '.join(energy).split()
+        # every line has the right number of values if and only if the
+        # labels are found where they are expected
+        if (len(tokens) != len(energy)*stride or
+                tokens[::stride].count(b'ENERGY:') != len(energy)):
+            for i, line in enumerate(batch, first+1):
+                if (line.startswith(b'ENERGY:') and
+                        len(line.split()) != stride):
+                    return i
+        if select is not None:
+            kept = select.indices(len(energy), tokens[1::stride])
+            if len(kept) != len(energy):
+                if not len(kept):
+                    continue
+                tokens = b' '.join([energy[i] for i in kept]).split()
+        data.extend_flat(tokens, 1, positions, stride)
+        if enabled():
+            count('values converted', len(tokens) // stride * len(data))
+    return 0
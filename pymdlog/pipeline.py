@@ -0,0 +1,144 @@
+"""
+Streaming of the frames of log files to output files and statistics.
+"""
+
+from __future__ import absolute_import
+try:
+    from future_builtins import zip
+except ImportError:
+    pass
+import warnings
+
+from .columns import ColumnData
+from .profiling import stage
+
+__all__ = ['FrameBuffer', 'IncompleteFrames', 'stream']
+
+# number of frames a data set may fall behind the x data set before it is
+# taken as not found in every frame
+MAX_LAG = 2
+
+
+class IncompleteFrames(RuntimeError):
+    """Raised when a data set is not found in every frame after some
+    frames are given, which can't be taken back."""
+
+    def __init__(self, title):
+        super(IncompleteFrames, self).__init__(
+                "Data set '%s' is not found in every frame." % title)
+        self.title = title
+
+
+class FrameBuffer(object):
+    """Assemble complete frames of the data sets given in pieces.
+
+    The data sets of a frame may be split between two pieces (the items of
+    AMBER frames are parsed one by one), so the values are kept until all
+    selected data sets of a frame are found. Only the selected data sets
+    are kept: x and y, or if y is not given, x and the data sets found in
+    the first frame, which is complete once the second one begins.
+
+    Like the normal mode, a data set not found in every frame is removed
+    with a warning, as long as no frame is given, otherwise
+    `IncompleteFrames` is raised.
+    """
+
+    def __init__(self, x, y=None):
+        self.x = x
+        self.titles = [x] + list(y) if y else None
+        self.auto = not y
+        self.pending = ColumnData()
+        # data sets removed, or found after the first frame if y is not
+        # given
+        self.removed = set()
+        # number of frames given by feed and flush
+        self.nframe = 0
+
+    def feed(self, data):
+        """Add a piece of data. Return the columns of the selected data sets
+        of the frames completed, in the order of titles."""
+        pending = self.pending
+        titles = self.titles
+        for t, v in data.items():
+            if titles is None or t in titles:
+                pending.add_column(t).extend(v)
+            elif self.auto and t not in self.removed:
+                self._remove(t)
+
+        n = len(pending.get(self.x, ()))
+        if titles is None:
+            if n <= 1:
+                return []
+            self.titles = titles = [self.x] + [t for t in pending
+                                               if t != self.x]
+            for t in list(pending):
+                if len(pending[t]) < n-1:
+                    self._remove(t)
+        elif n > 1:
+            for t in titles:
+                if t not in pending:
+                    raise ValueError("Data set '%s' not found." % t)
+        return self._take(n)
+
+    def flush(self):
+        """Return the columns of the remaining frames."""
+        if self.titles is None:
+            self.titles = [self.x] + [t for t in self.pending if t != self.x]
+        if self.x not in self.pending:
+            return []
+        return self._take(len(self.pending[self.x]), True)
+
+    def _remove(self, t):
+        warnings.warn("Number of '%s' data frames is not equal to '%s'. "
+                      "This item is meaningless and will be removed." %
+                      (t, self.x))
+        self.removed.add(t)
+        if self.titles is not None and t in self.titles:
+            self.titles.remove(t)
+        if t in self.pending:
+            del self.pending[t]
+
+    def _take(self, nx, last=False):
+        pending = self.pending
+        lag = 1 if last else MAX_LAG
+        for t in self.titles[1:]:
+            if nx - len(pending.get(t, ())) > lag:
+                if self.nframe:
+                    raise IncompleteFrames(t)
+                self._remove(t)
+        n = min(len(pending.get(t, ())) for t in self.titles)
+        if not n:
+            return []
+        cols = []
+        for t in self.titles:
+            cols.append(pending[t][:n])
+            del pending[t][:n]
+        self.nframe += n
+        return cols
+
+
+def stream(pieces, x, y=None, out=None, stats=None):
+    """Stream the frames of x and y (see `FrameBuffer`) in the pieces of
+    data into out, a writer with a write_rows method, and stats, a
+    `StatsCollector` of the y data sets, both of which are optional.
+    Return the titles of the data sets and the number of frames.
+
+    Only a few pieces are kept at a time, so the memory used doesn't grow
+    with the number of frames.
+    """
+    frames = FrameBuffer(x, y)
+
+    def put(cols):
+        if not cols:
+            return
+        if out is not None:
+            out.write_rows(zip(*cols))
+        if stats is not None:
+            with stage('stats'):
+                for t, c in zip(frames.titles[1:], cols[1:]):
+                    stats.add_column(t).extend(c)
+
+    for data in pieces:
+        put(frames.feed(data))
+    put(frames.flush())
+    return frames.titles, frames.nframe
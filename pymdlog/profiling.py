@@ -0,0 +1,298 @@
+"""
+Timers and counters of the stages of parsing and analyzing log files.
+
+The stages are timed and the counters added to by the code doing them:
+
+    detect         detecting the type of the input files
+    read           reading the lines of the files (an AMBER file read as
+                   a whole is read while it's parsed)
+    parse          matching the lines and converting the values
+    cache          loading and saving the cached data of the files
+    pool           waiting for the workers of a pool
+    merge          joining the data of the files
+    check          checking the lengths of the data sets
+    equilibration  detecting the equilibration phase
+    reduce         reducing the data for output
+    stats          computing the statistical results
+    write          writing the output files
+    plot           plotting
+
+    bytes read, lines scanned, lines matched, values converted, frames
+
+They are recorded by a `Profile` while it's entered, or passed to the
+hooks added by `add_hook`. Otherwise, a stage or counter costs no more
+than a check of whether anything is recorded, which is done once per
+batch of lines, not per line, in the parsers.
+"""
+
+from __future__ import absolute_import, division, print_function
+from collections import OrderedDict
+from functools import wraps
+import json
+import sys
+import time
+
+__all__ = ['Profile', 'add_hook', 'count', 'enabled', 'remove_hook',
+           'stage', 'timed']
+
+try:
+    clock = time.perf_counter
+except AttributeError:
+    # python 2.x
+    clock = time.time
+
+# the profiles being recorded and the hooks, see enabled
+_profiles = []
+_hooks = []
+
+
+def enabled():
+    """Return whether the stages and counters are recorded."""
+    return bool(_profiles or _hooks)
+
+
+def add_hook(func):
+    """Call func(kind, name, value) for every stage timed, with kind 'time'
+    and the seconds it took, and every count, with kind 'count' and the
+    number added, in the thread doing it."""
+    _hooks.append(func)
+
+
+def remove_hook(func):
+    """Remove a hook added by add_hook."""
+    _hooks.remove(func)
+
+
+def _emit(kind, name, value):
+    for profile in _profiles:
+        profile.add(kind, name, value)
+    for func in _hooks:
+        func(kind, name, value)
+
+
+def count(name, n=1):
+    """Add n to the counter name."""
+    if _profiles or _hooks:
+        _emit('count', name, n)
+
+
+class _Stage(object):
+    """Time a block as a call of a stage."""
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = clock()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        _emit('time', self.name, clock() - self.start)
+
+
+class _NoStage(object):
+    """Do nothing, when nothing is recorded."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        pass
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(name):
+    """Return a context manager timing its block as a call of the stage
+    name."""
+    if _profiles or _hooks:
+        return _Stage(name)
+    return _NO_STAGE
+
+
+def timed(name):
+    """Decorate a function to time its calls as the stage name."""
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not (_profiles or _hooks):
+                return func(*args, **kwargs)
+            with _Stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def timed_iter(iterable, name):
+    """Return iterable, whose items are timed as calls of the stage name as
+    they are taken if the stages are recorded."""
+    if not (_profiles or _hooks):
+        return iterable
+    return _timed_iter(iter(iterable), name)
+
+
+def _timed_iter(items, name):
+    while True:
+        with _Stage(name):
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+        yield item
+
+
+class Tally(object):
+    """Count the items and their total length taken from an iterable, or
+    the calls of a function, for the counters of the loops over lines,
+    which are added once at the end by count."""
+
+    def __init__(self, target):
+        self.target = target
+        self.n = 0
+        self.size = 0
+
+    def __iter__(self):
+        for item in self.target:
+            self.n += 1
+            self.size += len(item)
+            yield item
+
+    def __call__(self, *args):
+        self.n += 1
+        return self.target(*args)
+
+
+def value_count(data):
+    """Return the number of values in data, a `ColumnData` or
+    `StatsCollector`."""
+    return sum(len(data[t]) for t in data)
+
+
+def peak_rss():
+    """Return the peak resident set sizes in MB of the process and of its
+    children which have ended, like the workers of a pool, or None if
+    unknown."""
+    try:
+        # not on Windows
+        import resource
+    except ImportError:
+        return None
+    # bytes on macOS, KB elsewhere
+    unit = 1 << 20 if sys.platform == 'darwin' else 1 << 10
+    return tuple(resource.getrusage(who).ru_maxrss / unit
+                 for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN))
+
+
+def run_profiled(func, arg):
+    """Return func(arg) and what is recorded by a Profile meanwhile, which
+    is run by the workers of a process pool and added to the profiles of
+    the main process by `merge`."""
+    # those of the main process copied to a forked worker are of no use
+    del _profiles[:], _hooks[:]
+    with Profile() as profile:
+        result = func(arg)
+    return result, profile.state()
+
+
+def merge(state):
+    """Add what is recorded by another process (see `run_profiled`)."""
+    for name, (calls, seconds) in state['stages'].items():
+        for profile in _profiles:
+            profile.add('time', name, seconds, calls)
+        for func in _hooks:
+            func('time', name, seconds)
+    for name, n in state['counters'].items():
+        count(name, n)
+
+
+class Profile(object):
+    """The times and the numbers of calls of the stages, and the counters,
+    recorded while the profile is entered by `with profile:`, in any
+    thread. Those of the workers of a process pool are added when their
+    results are taken (see `analysis.imap`).
+
+    The stages of the workers of a pool are done at the same time, so the
+    times of the stages may add up to more than the wall time.
+    """
+
+    def __init__(self):
+        # imported here as the profiles are seldom used
+        import threading
+        self.lock = threading.Lock()
+        self.stages = OrderedDict()
+        self.counters = OrderedDict()
+        self.wall = 0.0
+        self.start = None
+
+    def __enter__(self):
+        self.start = clock()
+        _profiles.append(self)
+        return self
+
+    def __exit__(self, type, value, traceback):
+        _profiles.remove(self)
+        self.wall += clock() - self.start
+
+    def add(self, kind, name, value, calls=1):
+        """Add a stage timed or a count, like a hook (see add_hook)."""
+        with self.lock:
+            if kind == 'time':
+                entry = self.stages.get(name)
+                if entry is None:
+                    entry = self.stages[name] = [0, 0.0]
+                entry[0] += calls
+                entry[1] += value
+            else:
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def state(self):
+        """Return what is recorded, to be added to another profile."""
+        with self.lock:
+            return {'stages': dict((k, tuple(v))
+                                   for k, v in self.stages.items()),
+                    'counters': dict(self.counters)}
+
+    def report(self):
+        """Return the report as a dict, which is saved as JSON by save."""
+        stages = OrderedDict(
+                (name, OrderedDict([('calls', calls), ('seconds', seconds)]))
+                for name, (calls, seconds) in self.stages.items())
+        rss = peak_rss()
+        if rss is not None:
+            rss = OrderedDict([('self', rss[0]), ('children', rss[1])])
+        return OrderedDict([('wall_seconds', self.wall), ('stages', stages),
+                            ('counters', OrderedDict(self.counters)),
+                            ('peak_rss_mb', rss)])
+
+    def format(self):
+        """Return the report as text."""
+        lines = ['Profile: %.3f s' % self.wall,
+                 '%-16s %10s %10s %6s' % ('Stage', 'Calls', 'Seconds', '%')]
+        for name, (calls, seconds) in self.stages.items():
+            share = 100 * seconds / self.wall if self.wall else 0.0
+            lines.append('%-16s %10d %10.3f %6.1f' % (name, calls, seconds,
+                                                      share))
+        lines.append('%-16s %21s' % ('Counter', 'Value'))
+        for name, n in self.counters.items():
+            lines.append('%-16s %21d' % (name, n))
+        rss = peak_rss()
+        if rss is not None:
+            lines.append('Peak RSS: %.1f MB, %.1f MB of child processes' %
+                         rss)
+        return '\n'.join(lines) + '\n'
+
+    def save(self, fname='-'):
+        """Print the report, or write it to a file, in JSON if its name
+        ends with .json, or else as text."""
+        if fname == '-':
+            sys.stdout.write(self.format())
+            return
+        print('Write profile file %s' % fname)
+        with open(fname, 'w') as f:
+            if fname.lower().endswith('.json'):
+                json.dump(self.report(), f, indent=2)
+                f.write('\n')
+            else:
+                f.write(self.format())
@@ -0,0 +1,110 @@
+"""
+Progress of parsing log files, polled from another thread.
+"""
+
+from __future__ import absolute_import, division
+import os
+try:
+    from _thread import get_ident
+except ImportError:
+    from thread import get_ident
+
+from .archive import is_member, member_info
+
+__all__ = ['Cancelled', 'Progress']
+
+# the progress of the files parsed by each thread, see Progress.__enter__
+_watched = {}
+
+
+class Cancelled(Exception):
+    """Raised in the thread parsing the files when they are cancelled."""
+
+
+def watch(log):
+    """Report the parser log, just opened, to the progress of the thread,
+    if any, which raises Cancelled if it's cancelled."""
+    # nothing but this check when no progress is watched
+    if _watched:
+        progress = _watched.get(get_ident())
+        if progress is not None:
+            progress.opened(log)
+
+
+class Progress(object):
+    """Progress of parsing files in a thread, which is polled by another
+    one, like the GUI, and may be cancelled by it.
+
+    The parsers opened by the thread within `with progress:` report to
+    it, and the bytes read of the file being parsed are found by polling
+    its position (see `ReadOnlyTextFile.position`). When cancelled, the
+    file being parsed is closed, which stops its parser with an error, and
+    the next file opened raises Cancelled.
+    """
+
+    def __init__(self, filename=()):
+        self.cancelled = False
+        self.set_files(filename)
+
+    def set_files(self, filename):
+        """Set the files to be parsed, in order."""
+        self.files = list(filename)
+        self.sizes = [member_info(f).size if is_member(f) else
+                      os.path.getsize(f) for f in self.files]
+        self.total = sum(self.sizes)
+        # index of the file being parsed, and its parser
+        self.index = 0
+        self.log = None
+
+    def __enter__(self):
+        _watched[get_ident()] = self
+        return self
+
+    def __exit__(self, type, value, traceback):
+        del _watched[get_ident()]
+        self.log = None
+
+    def opened(self, log):
+        """Take the parser log of one of the files, opened by the thread
+        parsing them."""
+        if self.cancelled:
+            log.close()
+            raise Cancelled()
+        try:
+            self.index = self.files.index(log.filepath)
+        except ValueError:
+            # not one of the files, or the files are not set yet
+            return
+        self.log = log
+
+    def fraction(self):
+        """Return the fraction of the bytes of the files parsed."""
+        if not self.total:
+            return 0.0
+        i = self.index
+        done = sum(self.sizes[:i])
+        log = self.log
+        if log is not None:
+            pos = log.position()
+            if pos is not None:
+                done += min(pos, self.sizes[i])
+        return done / self.total
+
+    def current(self):
+        """Return the index and the name of the file being parsed, or None
+        if none is yet."""
+        if self.log is None:
+            return None
+        return self.index, self.log.filename
+
+    def cancel(self):
+        """Cancel parsing the files."""
+        self.cancelled = True
+        log = self.log
+        fp = None if log is None else log.fp
+        if fp is not None:
+            try:
+                fp.close()
+            except Exception:
+                # it's being closed by the parser as well
+                pass
@@ -0,0 +1,249 @@
+"""
+Reduction of data sets for output and plotting.
+"""
+
+from __future__ import absolute_import, division
+try:
+    from future_builtins import map, zip
+except ImportError:
+    pass
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import islice
+from math import fsum, sqrt
+from operator import gt
+try:
+    from itertools import accumulate
+except ImportError:
+    def accumulate(iterable):
+        total = 0
+        for i in iterable:
+            total += i
+            yield total
+
+from .profiling import timed
+
+__all__ = ['METHODS', 'MinMaxPyramid', 'downsample', 'lttb_indices',
+           'minmax_indices', 'reduce_data', 'rolling', 'stride_indices']
+
+# number of frames reduced at a time by rolling
+CHUNK = 65536
+
+# default maximum number of frames of a plot
+PLOT_POINTS = 10000
+
+# number of buckets of a level of a MinMaxPyramid merged into one of the
+# next level
+LEVEL_FACTOR = 4
+
+
+def take(values, indices):
+    """Return the values at indices, of the same type as values."""
+    if isinstance(values, array):
+        return array(values.typecode, [values[i] for i in indices])
+    return [values[i] for i in indices]
+
+
+def rolling(values, window):
+    """Return the rolling mean and SD of values over window frames, one per
+    full window.
+
+    The sums over the windows are differences of running sums, which are
+    restarted every CHUNK frames around the first value of the chunk to
+    keep them accurate.
+    """
+    n = len(values)
+    means, sds = array('d'), array('d')
+    for first in range(0, n-window+1, CHUNK):
+        chunk = values[first:min(n, first+CHUNK+window-1)]
+        k = chunk[0]
+        s = [0.0]
+        s.extend(accumulate(v-k for v in chunk))
+        ss = [0.0]
+        ss.extend(accumulate((v-k)**2 for v in chunk))
+        m = [(b-a)/window for a, b in zip(s, s[window:])]
+        means.extend(i+k for i in m)
+        sds.extend(sqrt(max(0.0, (b-a)/window - i*i))
+                   for a, b, i in zip(ss, ss[window:], m))
+    return means, sds
+
+
+def stride_indices(n, npoint):
+    """Return the indices of every k-th of n frames, with k chosen to keep
+    at most npoint frames."""
+    stride = max(1, -(-n // npoint))
+    return range(0, n, stride)
+
+
+def minmax_indices(y, npoint):
+    """Return the indices of the first and last frames, and of the minimum
+    and maximum of y in each of the buckets in between, in order, which
+    keep at most npoint frames."""
+    n = len(y)
+    nbucket = (npoint-2) // 2
+    if n <= npoint or nbucket < 1:
+        return stride_indices(n, npoint)
+    indices = [0]
+    for k in range(nbucket):
+        a = 1 + (n-2)*k//nbucket
+        b = 1 + (n-2)*(k+1)//nbucket
+        bucket = y[a:b]
+        i = bucket.index(min(bucket))
+        j = bucket.index(max(bucket))
+        indices.extend(a+i for i in sorted(set((i, j))))
+    indices.append(n-1)
+    return indices
+
+
+def lttb_indices(x, y, npoint):
+    """Return the indices of at most npoint frames chosen by the Largest
+    Triangle Three Buckets algorithm (Steinarsson, 2013).
+
+    The first and last frames are kept, and from each bucket in between,
+    the frame forming the largest triangle with the frame kept from the
+    previous bucket and the average of the next bucket, which keeps the
+    peaks of the curve.
+    """
+    n = len(y)
+    nbucket = npoint - 2
+    if n <= npoint or nbucket < 1:
+        return stride_indices(n, npoint)
+    bounds = [1 + (n-2)*k//nbucket for k in range(nbucket+1)] + [n]
+    indices = [0]
+    for k in range(nbucket):
+        a, b, c = bounds[k:k+3]
+        cx = fsum(x[b:c]) / (c-b)
+        cy = fsum(y[b:c]) / (c-b)
+        px, py = x[indices[-1]], y[indices[-1]]
+        # twice the areas of the triangles, up to the sign
+        dx, dy = cx-px, cy-py
+        c0 = dy*px - dx*py
+        areas = [abs(dx*v - dy*u + c0) for u, v in zip(x[a:b], y[a:b])]
+        indices.append(a + areas.index(max(areas)))
+    indices.append(n-1)
+    return indices
+
+
+METHODS = {
+        'lttb': lttb_indices,
+        'minmax': lambda x, y, npoint: minmax_indices(y, npoint),
+        'stride': lambda x, y, npoint: stride_indices(len(y), npoint)
+        }
+
+
+def downsample(xdat, ydat, npoint, method='lttb'):
+    """Return the frames of the x and y data sets chosen by method.
+
+    Each y data set gets an equal share of npoint, and the frames chosen
+    for any of them are kept in all data sets, so there are at most npoint
+    frames in total. With fewer than 3 frames each, as with many y data
+    sets, they are chosen by stride.
+    """
+    n = len(xdat)
+    if n <= npoint:
+        return xdat, ydat
+    try:
+        func = METHODS[method]
+    except KeyError:
+        raise ValueError("Unsupported downsampling method %s" % method)
+    share = max(1, npoint // max(1, len(ydat)))
+    indices = set()
+    for y in ydat:
+        indices.update(func(xdat, y, share))
+    indices = sorted(indices)
+    return take(xdat, indices), [take(y, indices) for y in ydat]
+
+
+class MinMaxPyramid(object):
+    """The minimum and maximum of a y data set over buckets of 4, 16, 64...
+    frames, by which the frames of any x range are decimated for a plot in
+    time proportional to the points plotted, not to the frames in the
+    range, so zooming and panning the plot of a long data set keep fast.
+
+    x has to be nondecreasing, or ValueError is raised. The buckets are
+    at fixed frames, so a panned plot doesn't flicker.
+    """
+
+    def __init__(self, x, y, factor=LEVEL_FACTOR):
+        if len(x) != len(y):
+            raise ValueError("x and y have different numbers of frames.")
+        if any(map(gt, x, islice(x, 1, None))):
+            raise ValueError("x is not in order.")
+        self.x = x
+        self.y = y
+        # (bucket size, x of the first frames, minima, maxima) by level,
+        # each computed from the level below without a loop in Python
+        self.levels = []
+        size, mins, maxs = 1, y, y
+        while len(mins) > factor:
+            size *= factor
+            mins = _merge(mins, min, factor)
+            maxs = _merge(maxs, max, factor)
+            self.levels.append((size, x[::size], mins, maxs))
+
+    def __len__(self):
+        return len(self.x)
+
+    def view(self, x0, x1, npoint):
+        """Return x and y of the frames from x0 to x1 plotted with at most
+        about npoint points. These are the frames themselves if few enough,
+        or else the minimum and maximum of each bucket of the finest level
+        with few enough buckets, both at the x of its first frame, which
+        draw the same envelope as all the frames at the resolution of the
+        plot. One more frame is kept on each side, so the lines reach the
+        edges of the plot."""
+        n = len(self.x)
+        i0 = max(0, bisect_left(self.x, x0) - 1)
+        i1 = min(n, bisect_right(self.x, x1) + 1)
+        if i1 - i0 <= npoint or not self.levels:
+            return self.x[i0:i1], self.y[i0:i1]
+        for size, xs, mins, maxs in self.levels:
+            if (i1-i0) // size <= npoint // 2:
+                break
+        j0, j1 = i0 // size, -(-i1 // size)
+        xs, mins, maxs = xs[j0:j1], mins[j0:j1], maxs[j0:j1]
+        px = xs * 2
+        px[::2] = xs
+        px[1::2] = xs
+        py = mins * 2
+        py[1::2] = maxs
+        py[::2] = mins
+        return px, py
+
+
+def _merge(values, func, factor):
+    """Return func (min or max) of every factor values, of the same type as
+    values."""
+    n = len(values)
+    # zip of the same iterator gives the full groups
+    merged = map(func, zip(*[iter(values)]*factor))
+    if isinstance(values, array):
+        merged = array(values.typecode, merged)
+    else:
+        merged = list(merged)
+    if n % factor:
+        merged.append(func(values[n-n % factor:]))
+    return merged
+
+
+@timed('reduce')
+def reduce_data(xdat, ydat, ylbs, window=None, max_points=None,
+                method='lttb'):
+    """Return the reduced x data set, y data sets and y titles.
+
+    With window, each y data set is replaced with its rolling mean and SD
+    (titled TITLE(SD)), at the x value of the center of the windows. With
+    max_points, at most that many frames are chosen by method.
+    """
+    if window and window > 1:
+        if window > len(xdat):
+            raise ValueError("The window is longer than the data sets.")
+        xdat = xdat[(window-1)//2:len(xdat)-window//2]
+        rolled, titles = [], []
+        for y, t in zip(ydat, ylbs):
+            rolled.extend(rolling(y, window))
+            titles.extend((t, t+'(SD)'))
+        ydat, ylbs = rolled, titles
+    if max_points:
+        xdat, ydat = downsample(xdat, ydat, max_points, method)
+    return xdat, ydat, ylbs
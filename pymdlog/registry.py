@@ -0,0 +1,161 @@
+"""
+Registry of the parsers of log files, by file type.
+
+A parser is a class like `NamdLogFile`, which is called with the file name
+and columns (the titles of the data sets to be parsed, or None for all),
+and has a filetype attribute and a read(container) method returning the
+data sets as a `ColumnData`. These are optional:
+
+    sniff(head)  a classmethod returning whether head, the first bytes of a
+                 file, are of the type, used to detect the type of files
+    x_title      the default x data set, by which the frames are counted
+    step_title   the data set of the steps, used to select the frames
+    pattern      the pattern of the file names of a run, used by batch
+
+and the iter_data, update, split, probe methods and select argument of
+the parsers of this package enable streaming, following, parsing in
+parallel and selecting frames.
+
+The parsers of other packages are registered with the entry points of the
+group 'pymdlog.parsers', named by the file type, like:
+
+    entry_points={'pymdlog.parsers': ['lammps = mypackage:LammpsLogFile']}
+"""
+
+from __future__ import absolute_import
+import warnings
+
+from .amberlogfile import AmberLogFile
+from .binfile import BinFile
+from .archive import is_member, open_member
+from .compressed import compression, open_compressed
+from .namdlogfile import NamdLogFile
+from .profiling import timed
+
+__all__ = ['AUTO', 'detect', 'get_parser', 'parser_types', 'register',
+           'sniff']
+
+# the file type of the files whose type is detected by sniff
+AUTO = 'auto'
+
+ENTRY_POINTS = 'pymdlog.parsers'
+
+# bytes of the beginning of a file given to the sniff methods
+SNIFF_SIZE = 1 << 12
+
+# parsers by file type, in the order they are sniffed
+_types = ['amber', 'namd', 'binary']
+_parsers = {'amber': AmberLogFile, 'namd': NamdLogFile, 'binary': BinFile}
+_loaded = False
+
+
+def register(type, parser):
+    """Register the parser class of the file type, which replaces the
+    parser registered before, if any."""
+    type = type.lower()
+    if type == AUTO:
+        raise ValueError("Can't register the file type %s" % type)
+    if type not in _parsers:
+        _types.append(type)
+    _parsers[type] = parser
+
+
+def load_entry_points():
+    """Register the parsers of the entry points, which is done once when
+    they are needed. A file type registered already is kept."""
+    global _loaded
+    if _loaded:
+        return
+    _loaded = True
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        try:
+            from pkg_resources import iter_entry_points
+        except ImportError:
+            return
+        eps = iter_entry_points(ENTRY_POINTS)
+    else:
+        eps = entry_points()
+        if hasattr(eps, 'select'):
+            eps = eps.select(group=ENTRY_POINTS)
+        else:
+            eps = eps.get(ENTRY_POINTS, ())
+    for ep in eps:
+        if ep.name.lower() in _parsers:
+            continue
+        try:
+            register(ep.name, ep.load())
+        except Exception as e:
+            warnings.warn("Failed to load the parser of %s files: %s" % (
+                          ep.name, e))
+
+
+def parser_types():
+    """Return the registered file types."""
+    load_entry_points()
+    return list(_types)
+
+
+def get_parser(type):
+    """Return the parser class of the file type."""
+    type = type.lower()
+    if type not in _parsers:
+        load_entry_points()
+    try:
+        return _parsers[type]
+    except KeyError:
+        raise ValueError("Unsupported file type %s" % type)
+
+
+def sniff(filename, size=SNIFF_SIZE):
+    """Return the type of the file detected from its first size bytes,
+    decompressed if it's compressed, or None if not detected. A member of
+    an archive is given as archive::member."""
+    kind = None if is_member(filename) else compression(filename)
+    if is_member(filename):
+        f = open_member(filename)[0]
+    elif kind is None:
+        f = open(filename, 'rb')
+    else:
+        f = open_compressed(filename, kind, ahead=0)
+    with f:
+        head = f.read(size)
+    found = _sniff(head)
+    if found is None and not _loaded:
+        load_entry_points()
+        found = _sniff(head)
+    return found
+
+
+def _sniff(head):
+    for type in _types:
+        test = getattr(_parsers[type], 'sniff', None)
+        if test is not None and test(head):
+            return type
+    return None
+
+
+@timed('detect')
+def detect(filename, type=AUTO):
+    """Return the file type and the parser class of the files, which are
+    detected by sniff if type is auto. The files are checked before any of
+    them is parsed, and ValueError is raised if the type of one can't be
+    detected or differs from the others or from type."""
+    types = [sniff(f) for f in filename]
+    if type.lower() == AUTO:
+        for f, t in zip(filename, types):
+            if t is None:
+                raise ValueError("Can't detect the type of '%s'." % f)
+            if t != types[0]:
+                raise ValueError("'%s' is a file of type %s, but '%s' is of "
+                                 "type %s." % (filename[0], types[0], f, t))
+        if not types:
+            raise ValueError("No input files.")
+        type = types[0]
+    parser = get_parser(type)
+    for f, t in zip(filename, types):
+        if t is not None and t != type.lower():
+            raise ValueError("'%s' is a file of type %s, not %s." % (
+                             f, t, type.lower()))
+    return type.lower(), parser
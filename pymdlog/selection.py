@@ -0,0 +1,206 @@
+"""
+Selection of frames by a range of steps or frame indices.
+"""
+
+from __future__ import absolute_import
+try:
+    from future_builtins import map
+except ImportError:
+    pass
+
+from .columns import STEP_TITLES, ColumnData
+from .reduction import take
+
+__all__ = ['FrameSelection', 'segment_ranges']
+
+BY = ('step', 'frame')
+
+# which of the overlapping frames of two segments are kept
+POLICIES = ('first', 'last')
+
+
+def segment_ranges(bounds, policy='first'):
+    """Return the range (lo, hi) of the steps kept of each segment of a
+    run, so that no step is kept twice, with bounds, the first and last
+    steps of the segments in order (None if unknown). Either end of a
+    range may be None.
+
+    With the policy 'first', the frames of a segment overlapping the
+    segments before it are dropped, and with 'last', the frames overlapped
+    by the segments after it are, e.g. the last frame of a segment whose
+    restart repeats it. The boundaries are gone through once, in order for
+    'first' and backwards for 'last'.
+    """
+    if policy not in POLICIES:
+        raise ValueError("Unsupported policy %s" % policy)
+    ranges = [(None, None)] * len(bounds)
+    edge = None
+    if policy == 'first':
+        for i, b in enumerate(bounds):
+            if b is None:
+                continue
+            if edge is not None:
+                ranges[i] = (edge+1, None)
+            edge = b[1] if edge is None else max(edge, b[1])
+    else:
+        for i in reversed(range(len(bounds))):
+            b = bounds[i]
+            if b is None:
+                continue
+            if edge is not None:
+                ranges[i] = (None, edge)
+            edge = b[0] if edge is None else min(edge, b[0])
+    return ranges
+
+
+class FrameSelection(object):
+    """Select frames by a range and a stride.
+
+    The range [start, stop) is of the steps (TS or NSTEP) if by is 'step',
+    or of the frame indices counting from 0 over all files if by is
+    'frame'. Either end may be None. Of the frames in the range, every
+    stride-th one is kept, starting with the first one.
+
+    The selection keeps count of the frames given to it, so the same one is
+    used for all files in order. The parsers take it to skip the frames
+    before they are converted.
+
+    The frames of the current segment out of the range of steps bounds
+    (see `segment_ranges`) are dropped as if they were not there, and
+    recorded by `finish` in drops, a list of (name, number, first step,
+    last step) of the frames dropped of each segment.
+    """
+
+    def __init__(self, start=None, stop=None, stride=1, by='step'):
+        if by not in BY:
+            raise ValueError("Unsupported selection by %s" % by)
+        if stride < 1:
+            raise ValueError("The stride has to be positive.")
+        self.start = start
+        self.stop = stop
+        self.stride = stride
+        self.by = by
+        # number of frames given, and of those in the range
+        self.nframe = 0
+        self.nrange = 0
+        self.bounds = None
+        self.drops = []
+        # number, first and last steps of the frames dropped of the segment
+        self._dropped = (0, None, None)
+
+    @property
+    def finished(self):
+        """Whether no more frames will be kept, which is known only when
+        selecting by frame."""
+        return (self.by == 'frame' and self.stop is not None and
+                self.nframe >= self.stop)
+
+    def skip(self, n):
+        """Count n frames skipped before the range, e.g. by seeking."""
+        self.nframe += n
+
+    def keep(self, step=None):
+        """Return whether the next frame, of step if selecting by step or
+        within bounds, is kept."""
+        if self.bounds is not None and not self._within(step):
+            self._drop((step,))
+            return False
+        i = self.nframe
+        self.nframe += 1
+        if self.by == 'step':
+            i = step
+        if (self.start is not None and i < self.start or
+                self.stop is not None and i >= self.stop):
+            return False
+        self.nrange += 1
+        return not (self.nrange-1) % self.stride
+
+    def indices(self, n, steps=None):
+        """Return the indices of the frames kept of the next n frames, with
+        steps, an iterable of their steps (numbers or bytes), if selecting
+        by step or within bounds."""
+        within = None
+        if self.bounds is not None:
+            steps = list(map(int, steps))
+            within = [i for i, s in enumerate(steps) if self._within(s)]
+            if len(within) == n:
+                within = None
+            else:
+                self._drop([s for s in steps if not self._within(s)])
+                steps = [steps[i] for i in within]
+                n = len(within)
+        kept = self._indices(n, steps)
+        if within is not None:
+            kept = [within[i] for i in kept]
+        return kept
+
+    def _indices(self, n, steps):
+        start, stop, stride = self.start, self.stop, self.stride
+        if self.by == 'frame':
+            lo = 0 if start is None else min(n, max(0, start-self.nframe))
+            hi = n if stop is None else min(n, max(0, stop-self.nframe))
+            self.nframe += n
+            if hi <= lo:
+                return range(0)
+            first = lo + (-self.nrange) % stride
+            self.nrange += hi - lo
+            return range(first, hi, stride)
+
+        inrange = [i for i, s in enumerate(map(int, steps))
+                   if (start is None or s >= start) and
+                   (stop is None or s < stop)]
+        self.nframe += n
+        kept = inrange[(-self.nrange) % stride::stride]
+        self.nrange += len(inrange)
+        return kept
+
+    def _within(self, step):
+        lo, hi = self.bounds
+        return (lo is None or step >= lo) and (hi is None or step < hi)
+
+    def _drop(self, steps):
+        n, first, last = self._dropped
+        if not n:
+            first = last = steps[0]
+        self._dropped = (n+len(steps), min(first, min(steps)),
+                         max(last, max(steps)))
+
+    def finish(self, name):
+        """Record the frames dropped of the segment name, and return the
+        record, or None if none is dropped."""
+        n, first, last = self._dropped
+        self._dropped = (0, None, None)
+        if not n:
+            return None
+        self.drops.append((name, n, first, last))
+        return self.drops[-1]
+
+    def skips(self, bounds):
+        """Return whether a file whose first and last steps are bounds (see
+        `ReadOnlyTextFile.probe`) has no frames in the range of steps."""
+        if self.by != 'step' or bounds is None:
+            return False
+        first, last = bounds
+        return (self.start is not None and last < self.start or
+                self.stop is not None and first >= self.stop)
+
+    def apply(self, data):
+        """Return the frames of data, a `ColumnData`, which are kept. The
+        data sets of other lengths than the steps are left as they are."""
+        steps = None
+        for t in STEP_TITLES:
+            if t in data:
+                steps = data[t]
+                break
+        if steps is None:
+            if self.by == 'step' or self.bounds is not None:
+                raise ValueError("No steps found to select the frames by.")
+            steps = next(iter(data.values()), ())
+        n = len(steps)
+        kept = self.indices(n, steps)
+        if len(kept) == n:
+            return data
+        newdata = ColumnData()
+        for t, v in data.items():
+            newdata[t] = take(v, kept) if len(v) == n else v
+        return newdata
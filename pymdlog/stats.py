@@ -2,16 +2,59 @@
 Statistical module.
 """
 
-from __future__ import division, print_function
+from __future__ import absolute_import, division, print_function
 try:
     from future_builtins import zip
 except ImportError:
     pass
-from math import sqrt, fsum
+from array import array
+from cmath import exp
+from math import sqrt, fsum, pi
 
-__all__ = ['ITEMS', 'calc_stats', 'save_stats']
+from .columns import ColumnData, FLOAT_TYPECODE, typecode_of
+from .profiling import timed
 
-ITEMS = ('Title', 'Population', 'Mean', 'SD', 'SEM', 'Max', 'Min', 'CI95%')
+__all__ = ['ITEMS', 'StatsAccumulator', 'StatsCollector', 'calc_stats',
+           'save_stats']
+
+ITEMS = ('Title', 'Population', 'Mean', 'SD', 'SEM', 'Max', 'Min', 'CI95%',
+         'Ineff', 'SEM(block)', 'SEM(corr)', 'CI95%(corr)')
+
+# number of buffered values reduced at a time by StatsAccumulator.add
+CHUNK = 65536
+
+# the autocorrelation function is summed up to the smallest lag M with
+# M >= WINDOW * g(M) (the automatic windowing of Sokal)
+WINDOW = 5
+
+# maximum number of values transformed at a time with numpy
+FFT_SIZE = 1 << 24
+
+# how the statistical inefficiency is estimated, noted in the stats file
+AUTOCORRELATION = 'autocorrelation function'
+BLOCKING = 'block averages'
+
+# numpy, or None if not available, once checked by get_numpy
+_numpy = []
+
+
+def get_numpy():
+    """Return numpy, imported when first needed, or None if it's not
+    available."""
+    if not _numpy:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        _numpy.append(numpy)
+    return _numpy[0]
+
+
+def ineff_method():
+    """Return how calc_stats estimates the statistical inefficiency,
+    AUTOCORRELATION with numpy, otherwise BLOCKING like a
+    `StatsCollector`."""
+    return BLOCKING if get_numpy() is None else AUTOCORRELATION
 
 
 def mean(data):
@@ -38,18 +81,364 @@ def ci95(data):
     return m-d, m+d
 
 
+def combine(a, b):
+    """Combine the (count, mean, sum of squared deviations) of two data
+    sets with the pairwise update of Chan et al."""
+    n1, m1, s1 = a
+    n2, m2, s2 = b
+    if not n1:
+        return b
+    if not n2:
+        return a
+    n = n1 + n2
+    delta = m2 - m1
+    return n, m1 + delta*n2/n, s1 + s2 + delta*delta*n1*n2/n
+
+
+def moments(values):
+    """Return the (count, mean, sum of squared deviations) of values."""
+    n = len(values)
+    m = fsum(values) / n
+    return n, m, fsum((i-m)**2 for i in values)
+
+
+def block_sem(blocks):
+    """Choose the SEM of the blocking analysis of Flyvbjerg and Petersen.
+
+    blocks is the list of (count, mean, sum of squared deviations) of the
+    block averages, where the block size is doubled from one item to the
+    next starting at 1. The optimal block size B is the smallest one with
+    B**3 > 2*n*(SEM(B)/SEM(1))**4 (Lee et al., 2011). Return nan if the
+    data set is too short to reach it.
+    """
+    sems = [sqrt(m2/n/(n-1)) for n, _, m2 in blocks if n > 1]
+    if not sems:
+        return float('nan')
+    if not sems[0]:
+        return 0.0
+    n = blocks[0][0]
+    for i, e in enumerate(sems):
+        if 2**(3*i) > 2*n*(e/sems[0])**4:
+            return e
+    return float('nan')
+
+
+def fft(x):
+    """Return the discrete Fourier transform of x, a list of complex numbers
+    whose length is a power of 2, in pure Python.
+
+    The Stockham formulation is used: every pass works on whole slices of
+    the list, so the loops run in list comprehensions.
+    """
+    n = len(x)
+    half = n // 2
+    w = [exp(-2j*pi*k/n) for k in range(half)]
+    s, m = 1, half
+    while m:
+        a, b = x[:half], x[half:]
+        x = [0j]*n
+        if s < m:
+            for q in range(s):
+                aq, bq = a[q::s], b[q::s]
+                x[q::2*s] = [u+v for u, v in zip(aq, bq)]
+                x[s+q::2*s] = [(u-v)*t for u, v, t in zip(aq, bq, w[::s])]
+        else:
+            for p in range(m):
+                ap, bp = a[p*s:(p+1)*s], b[p*s:(p+1)*s]
+                t = w[p*s]
+                x[2*p*s:(2*p+1)*s] = [u+v for u, v in zip(ap, bp)]
+                x[(2*p+1)*s:(2*p+2)*s] = [(u-v)*t for u, v in zip(ap, bp)]
+        s, m = 2*s, m//2
+    return x
+
+
+def fft_size(n):
+    """Return the length the data sets of length n are padded to, so that
+    the circular correlation of the FFT doesn't wrap around."""
+    size = 1
+    while size < 2*n:
+        size *= 2
+    return size
+
+
+def autocovariance(x, y):
+    """Return the (unnormalized) autocovariance functions of two data sets
+    of the same length, computed with the FFT in pure Python.
+
+    Both are transformed at once as the real and imaginary parts of a
+    single complex sequence.
+    """
+    n = len(x)
+    mx, my = fsum(x)/n, fsum(y)/n
+    size = fft_size(n)
+    z = fft([complex(a-mx, b-my) for a, b in zip(x, y)] + [0j]*(size-n))
+    # the power spectra of x and y, from Z[k] and Z[-k]
+    rev = z[:1] + z[:0:-1]
+    p = [complex(abs(a+b.conjugate())**2, abs(a-b.conjugate())**2)
+         for a, b in zip(z, rev)]
+    # the spectra are real and even, so a forward transform is an inverse
+    # one, and the autocovariances are real
+    c = fft(p)[:n]
+    return [i.real for i in c], [i.imag for i in c]
+
+
+def inefficiency(acov):
+    """Return the statistical inefficiency g = 1 + 2*sum(rho(t)) (the
+    integrated autocorrelation time), where rho is the autocorrelation
+    function computed from the autocovariance function acov."""
+    if not acov[0] > 0:
+        return 1.0
+    g = 1.0
+    for m in range(1, len(acov)):
+        g += 2*acov[m]/acov[0]
+        if m >= WINDOW*g:
+            break
+    return max(g, 1.0)
+
+
+def inefficiencies(data):
+    """Return the statistical inefficiencies of the data sets.
+
+    The autocorrelation functions are computed with the FFT in O(n log n).
+    numpy is used if available, with the data sets of the same length
+    transformed together as a 2D array; otherwise the pure Python FFT is
+    used on pairs of data sets.
+    """
+    groups = {}
+    for i, d in enumerate(data):
+        groups.setdefault(len(d), []).append(i)
+    result = [1.0]*len(data)
+    numpy = get_numpy()
+    for n, ids in groups.items():
+        if n < 2:
+            continue
+        if numpy is not None:
+            step = max(1, FFT_SIZE // fft_size(n))
+            for first in range(0, len(ids), step):
+                sub = ids[first:first+step]
+                g = _np_inefficiencies(numpy, [data[i] for i in sub])
+                for i, v in zip(sub, g):
+                    result[i] = v
+        else:
+            for first in range(0, len(ids), 2):
+                i = ids[first]
+                j = ids[first+1] if first+1 < len(ids) else i
+                ci, cj = autocovariance(data[i], data[j])
+                result[i] = inefficiency(ci)
+                result[j] = inefficiency(cj)
+    return result
+
+
+def _np_inefficiencies(np, data):
+    """Return the statistical inefficiencies of the data sets of the same
+    length with numpy."""
+    x = np.array([np.asarray(d) for d in data], dtype=float)
+    n = x.shape[1]
+    x -= x.mean(axis=1)[:, None]
+    size = fft_size(n)
+    f = np.fft.rfft(x, n=size)
+    acov = np.fft.irfft(f.real**2 + f.imag**2, n=size)[:, :n]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        g = 2*np.cumsum(acov/acov[:, :1], axis=1) - 1
+    lag = np.arange(n) >= WINDOW*g
+    window = np.where(lag.any(axis=1), lag.argmax(axis=1), n-1)
+    g = g[np.arange(len(data)), window]
+    g[~(acov[:, 0] > 0)] = 1.0
+    return [float(i) for i in np.maximum(g, 1.0)]
+
+
+class StatsAccumulator(object):
+    """Accumulate the statistical results of a data set in a single pass.
+
+    Values fed one by one with `add` are buffered and reduced a chunk at a
+    time. The count, mean and sum of squared deviations of the chunks (or
+    of whole sequences given to `extend`) are combined with the pairwise
+    update of Chan et al., so accumulators of separate files or workers can
+    be merged with `merge`. The results of a single sequence given to
+    `extend`, as by calc_stats, are those of `mean` and `sd`; those
+    combined from chunks, as when streaming, match them only to
+    floating-point rounding.
+
+    The values are also averaged in blocks of 2, 4, 8, ... on the fly for
+    the blocking analysis, which only keeps the moments of each block size
+    and one pending value per size. The blocks spanning the boundary of
+    merged accumulators are dropped.
+    """
+
+    def __init__(self, typecode=FLOAT_TYPECODE):
+        self.typecode = typecode
+        self.n = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._max = self._min = None
+        self._buf = array(typecode)
+        # moments of the block averages of sizes 2, 4, 8, ...
+        self._blocks = []
+        # the values waiting for their pairs, of sizes 1, 2, 4, ...
+        self._carry = []
+
+    def add(self, value):
+        """Add a single value."""
+        buf = self._buf
+        buf.append(value)
+        if len(buf) >= CHUNK:
+            self._flush()
+
+    append = add
+
+    def extend(self, values):
+        """Add a sequence of values or merge another accumulator."""
+        if isinstance(values, StatsAccumulator):
+            self.merge(values)
+            return
+        self._flush()
+        if not isinstance(values, (array, list, tuple)):
+            values = array(self.typecode, values)
+        self._reduce(values)
+
+    def merge(self, other):
+        """Merge the results of another accumulator, whose values follow
+        those of this one, into this one."""
+        self._flush()
+        other._flush()
+        self._combine(other.n, other._mean, other._m2, other._max, other._min)
+        for i, b in enumerate(other._blocks):
+            if i < len(self._blocks):
+                self._blocks[i] = combine(self._blocks[i], b)
+            else:
+                self._blocks.append(b)
+        # the values pending here are not next to the values to come
+        self._carry = other._carry[:]
+
+    def _flush(self):
+        if self._buf:
+            self._reduce(self._buf)
+            self._buf = array(self.typecode)
+
+    def _reduce(self, values):
+        if not len(values):
+            return
+        n, m, m2 = moments(values)
+        self._combine(n, m, m2, max(values), min(values))
+        self._block(values)
+
+    def _combine(self, n, m, m2, hi, lo):
+        if not n:
+            return
+        if not self.n:
+            self.n, self._mean, self._m2 = n, m, m2
+            self._max, self._min = hi, lo
+            return
+        self.n, self._mean, self._m2 = combine((self.n, self._mean, self._m2),
+                                               (n, m, m2))
+        self._max = max(self._max, hi)
+        self._min = min(self._min, lo)
+
+    def _block(self, values):
+        """Average the values in pairs, and the averages in pairs again,
+        until no pair is left."""
+        carry, blocks = self._carry, self._blocks
+        level = 0
+        while len(values):
+            if level == len(carry):
+                carry.append(None)
+            head = []
+            if carry[level] is not None:
+                head = [(carry[level]+values[0]) / 2]
+                values = values[1:]
+            carry[level] = values[-1] if len(values) % 2 else None
+            values = head + [(a+b) / 2 for a, b in zip(values[::2],
+                                                       values[1::2])]
+            if values:
+                if level == len(blocks):
+                    blocks.append((0, 0.0, 0.0))
+                blocks[level] = combine(blocks[level], moments(values))
+            level += 1
+
+    def __len__(self):
+        return self.n + len(self._buf)
+
+    def block_sem(self):
+        """Return the SEM of the blocking analysis."""
+        self._flush()
+        return block_sem([(self.n, self._mean, self._m2)] + self._blocks)
+
+    def result(self, title, ineff=None):
+        """Return the statistical results in the order of ITEMS.
+
+        The SEM is corrected with the statistical inefficiency ineff, which
+        is estimated from the blocking analysis if not given, so SEM(corr)
+        is then SEM(block), or SEM if that is smaller.
+        """
+        self._flush()
+        n = self.n
+        m = self._mean
+        s = sqrt(self._m2 / n)
+        e = s / sqrt(n)
+        d = 1.96*e
+        eb = self.block_sem()
+        if ineff is None:
+            # at least 1 like inefficiency, or nan if eb is unknown
+            ineff = max((eb/e)**2, 1.0) if e else 1.0
+        ec = e*sqrt(ineff)
+        dc = 1.96*ec
+        return (title, n, m, s, e, self._max, self._min,
+                '(%s, %s)' % (m-d, m+d), ineff, eb, ec,
+                '(%s, %s)' % (m-dc, m+dc))
+
+
+class StatsCollector(ColumnData):
+    """Collect statistical results of data sets frame by frame.
+
+    It is filled by the parsers the same way as a `ColumnData`, but keeps a
+    `StatsAccumulator` instead of the values for each data set.
+    """
+
+    def new_column(self, title):
+        return StatsAccumulator(typecode_of(title))
+
+    @timed('stats')
+    def calc_stats(self, titles=None):
+        """Return the statistical results of titles (default: all)."""
+        return [self[t].result(t) for t in (titles or self)]
+
+
+@timed('stats')
 def calc_stats(titles, data):
-    """Calculate statistical results."""
-    return [(t, len(d), mean(d), sd(d), sem(d), max(d), min(d),
-            '(%s, %s)'%ci95(d))
-            for t, d in zip(titles, data)]
+    """Calculate statistical results.
+
+    With numpy, the statistical inefficiencies are computed from the
+    autocorrelation functions of all the data sets in one go. Otherwise
+    they are estimated from the blocking analysis, like those of a
+    `StatsCollector`, as the FFT in pure Python takes much longer than
+    the rest of the results.
+    """
+    titles, data = list(titles), list(data)[:len(titles)]
+    if ineff_method() == AUTOCORRELATION:
+        ineffs = inefficiencies(data)
+    else:
+        ineffs = [None] * len(data)
+    values = []
+    for t, d, g in zip(titles, data, ineffs):
+        acc = StatsAccumulator()
+        acc.extend(d)
+        values.append(acc.result(t, g))
+    return values
 
 
-def save_stats(data, fname='stats.log'):
-    """Save statistical results in a file."""
+@timed('write')
+def save_stats(data, fname='stats.log', notes=(), method=None):
+    """Save statistical results in a file. The notes are written before
+    them as comment lines starting with '#', and so is method, how the
+    statistical inefficiency is estimated (default: `ineff_method`, for
+    the results of calc_stats)."""
     print('Write statistical data file %s' % fname)
     fmt = '"%s"' + ' %s'*(len(ITEMS)-1) + '\n'
     with open(fname, 'w') as f:
+        for note in notes:
+            f.write('# %s\n' % note)
+        f.write('# Ineff: estimated from the %s\n' %
+                (method or ineff_method()))
         f.write(' '.join(ITEMS)+'\n')
         for d in data:
             f.write(fmt % tuple(d))
@@ -0,0 +1,231 @@
+"""
+Index of the steps of log files, kept in sidecar files.
+"""
+
+from __future__ import absolute_import
+from array import array
+from bisect import bisect_left
+import os
+import struct
+import sys
+import warnings
+import zlib
+
+__all__ = ['StepIndex']
+
+# default number of frames between two indexed frames
+EVERY = 100
+
+# bytes of the beginning of a file checked to tell if it was replaced
+HEAD_SIZE = 1 << 12
+
+# bytes of a log file scanned at a time
+CHUNK = 1 << 22
+
+SUFFIX = '.pmi'
+MAGIC = b'PMI\x01'
+
+# magic, every, flags, head size, head crc, scanned bytes, number of frames
+# and of lines scanned
+HEADER = struct.Struct('<4sIIIIqqq')
+STARTED, FINISHED = 1, 2
+
+
+def crc(data):
+    return zlib.crc32(data) & 0xffffffff
+
+
+class StepIndex(object):
+    """Byte offsets of the frames of a log file.
+
+    The offset, step and line number of every every-th frame are kept, so a
+    parser can seek to the frames of a range of steps, or of frame indices,
+    instead of reading from the beginning. A frame begins with a match of
+    the pattern of the steps of the parser (pat_step), and the frames are
+    only looked for between the matches of pat_begin and pat_end, if the
+    parser has them.
+
+    The index is saved next to the log file (FILE.pmi) and only the lines
+    appended since are scanned when it's opened again, which is why the
+    numbers of frames and lines scanned are kept as well.
+    """
+
+    def __init__(self, every=EVERY):
+        self.every = every
+        # offset, step, line number of the frames 0, every, 2*every...
+        self.entries = array('q')
+        self.started = self.finished = False
+        self.head = (0, 0)
+        self.scanned = self.nframe = self.lineno = 0
+
+    @classmethod
+    def open(cls, log, every=EVERY):
+        """Return the index of the log file of the parser log, which is
+        loaded from the sidecar file, extended with the frames appended
+        since and saved again. A sidecar file of another log file or of a
+        different every is rebuilt."""
+        path = log.filepath + SUFFIX
+        index = None
+        try:
+            index = cls.load(path)
+        except (IOError, OSError, ValueError, struct.error):
+            pass
+        if (index is None or index.every != every or
+                not index.matches(log.fp)):
+            index = cls(every)
+        if index.extend(log):
+            try:
+                index.save(path)
+            except (IOError, OSError) as e:
+                warnings.warn("Failed to save the step index '%s': %s" % (
+                              path, e))
+        return index
+
+    def matches(self, fp):
+        """Return whether the index is of the file, which has to be the
+        one scanned, possibly with lines appended."""
+        size, value = self.head
+        if os.fstat(fp.fileno()).st_size < self.scanned:
+            return False
+        pos = fp.tell()
+        fp.seek(0)
+        try:
+            return crc(fp.read(size)) == value
+        finally:
+            fp.seek(pos)
+
+    def extend(self, log, size=CHUNK):
+        """Scan the complete lines of the log file after the part already
+        scanned. Return whether any line is scanned."""
+        fp = log.fp
+        pat_step = log.pat_step
+        pat_begin = getattr(log, 'pat_begin', None)
+        pat_end = getattr(log, 'pat_end', None)
+        every = self.every
+        entries = self.entries
+        start = self.scanned
+        pos = fp.tell()
+        try:
+            if self.head[0] < HEAD_SIZE:
+                # the beginning is checked as it grows
+                fp.seek(0)
+                head = fp.read(HEAD_SIZE)
+                self.head = (len(head), crc(head))
+            fp.seek(self.scanned)
+            while not self.finished:
+                block = fp.read(size)
+                if block and not block.endswith(b'\n'):
+                    block += fp.readline()
+                # the last line may be still being written
+                cut = block.rfind(b'\n') + 1
+                partial = cut < len(block)
+                if partial:
+                    block = block[:cut]
+                if not block:
+                    break
+
+                first = 0
+                if not self.started:
+                    m = None if pat_begin is None else pat_begin.search(block)
+                    self.started = pat_begin is None or m is not None
+                    if m is not None:
+                        first = m.end()
+                last = len(block)
+                if self.started and pat_end is not None:
+                    m = pat_end.search(block, first)
+                    if m is not None:
+                        last = m.start()
+                        self.finished = True
+
+                # the line numbers are only counted up to the frames indexed
+                lineno, counted = self.lineno, 0
+                if self.started:
+                    for m in pat_step.finditer(block, first, last):
+                        if not self.nframe % every:
+                            i = m.start()
+                            lineno += block.count(b'\n', counted, i)
+                            counted = i
+                            entries.extend((self.scanned+i, int(m.group(1)),
+                                            lineno))
+                        self.nframe += 1
+                self.lineno = lineno + block.count(b'\n', counted)
+                self.scanned += len(block)
+                if partial:
+                    break
+        finally:
+            fp.seek(pos)
+        return self.scanned != start
+
+    def find(self, select):
+        """Return the (offset, frame, line number) of the last indexed frame
+        before the frames selected by select (a `FrameSelection`), or None,
+        and the offset of the first indexed frame after them, or None.
+
+        The frames are counted from the beginning of the file, while select
+        counts them over all files, so the frames of the files before have
+        to be given to select already. Selecting by step requires the steps
+        not to go back within the file.
+        """
+        n = len(self.entries) // 3
+        start, stop = select.start, select.stop
+        if select.by == 'frame':
+            every, nframe = self.every, select.nframe
+            first = None if start is None else (start-nframe) // every
+            last = None if stop is None else -(-(stop-nframe) // every)
+        else:
+            steps = self.entries[1::3]
+            if any(a > b for a, b in zip(steps, steps[1:])):
+                return None, None
+            first = None if start is None else bisect_left(steps, start) - 1
+            last = None if stop is None else bisect_left(steps, stop)
+        before = after = None
+        if first is not None and first > 0:
+            i = min(first, n-1)
+            before = (self.entries[3*i], i*self.every, self.entries[3*i+2])
+        if last is not None and last < n:
+            after = self.entries[3*max(0, last)]
+        return before, after
+
+    @classmethod
+    def load(cls, path):
+        """Load an index saved by save."""
+        with open(path, 'rb') as f:
+            header = HEADER.unpack(f.read(HEADER.size))
+            if header[0] != MAGIC:
+                raise ValueError("Invalid step index '%s'" % path)
+            index = cls(header[1])
+            index.started = bool(header[2] & STARTED)
+            index.finished = bool(header[2] & FINISHED)
+            index.head = header[3:5]
+            index.scanned, index.nframe, index.lineno = header[5:]
+            # the file may be longer if it was being written
+            n = -(-index.nframe // index.every) * 3
+            index.entries.fromfile(f, n)
+        if sys.byteorder == 'big':
+            index.entries.byteswap()
+        return index
+
+    def save(self, path):
+        """Save the index to a file, which is replaced as a whole so that
+        other processes never see a partially written index."""
+        import tempfile
+        flags = (self.started and STARTED) | (self.finished and FINISHED)
+        entries = self.entries
+        if sys.byteorder == 'big':
+            entries = array('q', entries)
+            entries.byteswap()
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+                                   suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, self.every, flags, self.head[0],
+                                    self.head[1], self.scanned, self.nframe,
+                                    self.lineno))
+                entries.tofile(f)
+            if os.path.exists(path):
+                os.remove(path)
+            os.rename(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
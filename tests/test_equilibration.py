@@ -0,0 +1,73 @@
+from __future__ import absolute_import, division
+import random
+import unittest
+
+from pymdlog.equilibration import (CANDIDATES, MIN_CANDIDATES, correlate,
+                                   detect_equilibration)
+from pymdlog.stats import WINDOW, inefficiencies, inefficiency
+
+
+def lagged_sums(u, v, nlag):
+    return [sum(u[i]*v[i+t] for i in range(len(u)) if i+t < len(v))
+            for t in range(nlag+1)]
+
+
+def ar1(n, phi, seed):
+    rng = random.Random(seed)
+    x, v = [], 10.0
+    for _ in range(n):
+        v = phi*v + rng.gauss(0, 1)
+        x.append(v)
+    return x
+
+
+def direct_start(x, nlag, bounds):
+    # the autocovariance after each candidate computed from scratch
+    best, start = None, 0
+    for t0 in reversed(bounds[:-1]):
+        y = x[t0:]
+        m = sum(y) / len(y)
+        y = [i-m for i in y]
+        acov = [sum(y[i]*y[i+t] for i in range(len(y)-t))
+                for t in range(min(nlag, len(y)-1)+1)]
+        neff = len(y) / inefficiency(acov)
+        if best is None or neff >= best:
+            best, start = neff, t0
+    return start
+
+
+class TestCorrelate(unittest.TestCase):
+
+    def check(self, nu, nv, nlag):
+        rng = random.Random(nu)
+        us = [[rng.uniform(-1, 1) for _ in range(nu)] for _ in range(2)]
+        vs = [u + [rng.uniform(-1, 1) for _ in range(nv-nu)] for u in us]
+        for u, v, c in zip(us, vs, correlate(us, vs, nlag)):
+            for a, b in zip(c, lagged_sums(u, v, nlag)):
+                self.assertAlmostEqual(a, b, places=9)
+
+    def test_longer_v(self):
+        self.check(100, 110, 10)
+
+    def test_last_segment(self):
+        # v cut off at the end of the data, as long as u
+        self.check(205, 205, 204)
+        self.check(128, 128, 5)
+
+
+class TestDetectEquilibration(unittest.TestCase):
+
+    def test_direct(self):
+        for seed in range(4):
+            x = ar1(300, 0.98, seed)
+            n = len(x)
+            nlag = int(WINDOW*inefficiencies([x])[0]) + 1
+            nlag = min(nlag, n // MIN_CANDIDATES)
+            ncand = min(CANDIDATES, n // nlag)
+            bounds = [n*k//ncand for k in range(ncand+1)]
+            self.assertEqual(detect_equilibration([x]),
+                             [direct_start(x, nlag, bounds)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+from __future__ import absolute_import
+import unittest
+import warnings
+
+from pymdlog.columns import ColumnData
+from pymdlog.pipeline import FrameBuffer, IncompleteFrames
+
+
+def piece(nframe, titles, start=0):
+    data = ColumnData()
+    for t in titles:
+        data.add_column(t).extend(range(start, start+nframe))
+    return data
+
+
+class TestFrameBuffer(unittest.TestCase):
+
+    def test_removed_before_any_frame(self):
+        frames = FrameBuffer('TS')
+        data = piece(10, ['TS', 'A'])
+        data.add_column('B').extend(range(5))
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            cols = frames.feed(data)
+            # found after the first frame
+            cols += frames.feed(piece(10, ['TS', 'A', 'C'], 10))
+        self.assertEqual(frames.titles, ['TS', 'A'])
+        self.assertEqual([len(c) for c in cols], [10, 10, 10, 10])
+        self.assertEqual(len(caught), 2)
+
+    def test_removed_after_frames(self):
+        frames = FrameBuffer('TS', ['A', 'B'])
+        frames.feed(piece(10, ['TS', 'A', 'B']))
+        self.assertRaises(IncompleteFrames, frames.feed,
+                          piece(10, ['TS', 'A'], 10))
+
+
+if __name__ == '__main__':
+    unittest.main()